@@ -1,18 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import mysql.connector
 from mysql.connector import Error
 import hashlib
+import re
+import atexit
 import cv2
 import numpy as np
 from ultralytics import YOLO
+from scipy.optimize import linear_sum_assignment
 import json
 from datetime import datetime, timedelta
 import base64
 import os
+import shutil
 import jwt
 from functools import wraps
 import csv
+import threading
+import queue
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
 from io import StringIO, BytesIO
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib import colors
@@ -20,13 +30,137 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.units import inch
 
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
+
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 app = Flask(__name__)
 CORS(app)
+sock = Sock(app) if Sock else None
+
+if orjson:
+    class OrjsonProvider(DefaultJSONProvider):
+        """orjson encoder for jsonify, falls back to the stdlib encoder for anything it rejects"""
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        compact = True  # debug mode would otherwise pretty-print every response
+        
+        def dumps(self, obj, **kwargs):
+            option = self.options | (orjson.OPT_INDENT_2 if kwargs.get('indent') else 0)
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+            except TypeError:
+                return super().dumps(obj, **kwargs)
+    
+    app.json = OrjsonProvider(app)
 
 # JWT Configuration
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
 app.config['JWT_EXPIRATION_HOURS'] = 24
 
+# Inference batching configuration
+app.config['INFERENCE_MAX_BATCH'] = 8
+app.config['INFERENCE_MAX_WAIT_MS'] = 10
+app.config['INFERENCE_TIMEOUT_SEC'] = 30  # a request gives up instead of hanging on a stuck worker
+
+# Motion gate configuration (skip inference on static frames)
+app.config['MOTION_GATE_ENABLED'] = True
+app.config['MOTION_THRESHOLD'] = 0.005  # Fraction of pixels that must change
+app.config['MOTION_PIXEL_DELTA'] = 25  # Grey-level difference counted as a change
+app.config['MOTION_MAX_SKIP'] = 30  # Force a fresh detection after this many reused frames
+
+# Keyframe mode (detect every Nth frame, propagate boxes with optical flow in between)
+app.config['KEYFRAME_MODE_ENABLED'] = False
+app.config['KEYFRAME_MIN_INTERVAL'] = 2
+app.config['KEYFRAME_MAX_INTERVAL'] = 10
+app.config['KEYFRAME_MOTION_SCALE'] = 8.0  # Median flow (px/frame) that halves the interval
+
+# Zone-ROI inference (only run the detector on the area covered by zones and the crossing line)
+app.config['ROI_INFERENCE_ENABLED'] = False
+app.config['ROI_MARGIN'] = 32
+app.config['ROI_MAX_AREA_RATIO'] = 0.8  # Use the full frame when the crop would not save much
+
+# Tiled inference for large images
+app.config['TILE_SIZE'] = 640
+app.config['TILE_OVERLAP'] = 0.2
+app.config['TILE_AUTO_MIN_SIDE'] = 1920  # Tile automatically when the longer side reaches this
+app.config['TILE_NMS_IOU'] = 0.5
+app.config['TILE_NMS_IOS'] = 0.8  # Intersection over the smaller box, catches people cut by a tile edge
+# Both rules only compare boxes from different tiles, YOLO already ran NMS inside each tile
+
+# Detection result cache for analyze_image
+app.config['DETECTION_CACHE_SIZE'] = 256
+app.config['DETECTION_CACHE_DIR'] = None  # e.g. 'cache/detections' to keep results across restarts
+
+# Webcam pipeline (capture, inference, annotation and encoding run in overlapping threads)
+app.config['WEBCAM_PIPELINE_ENABLED'] = True
+app.config['PIPELINE_QUEUE_SIZE'] = 2
+app.config['PIPELINE_INFERENCE_FPS'] = 10  # frames per second sent to detection, 0 for every captured frame
+app.config['PIPELINE_IDLE_SEC'] = 5  # pause detection once no poller or stream client was seen for this long
+
+# Multi-object tracking (Kalman prediction + Hungarian assignment)
+app.config['TRACK_MAX_AGE'] = 30  # frames a lost track can be re-identified
+app.config['TRACK_IOU_THRESHOLD'] = 0.3
+app.config['TRACK_HIGH_CONFIDENCE'] = 0.5
+app.config['TRACK_MAX_DISTANCE'] = 100  # pixels, last-resort center match for lost or fast tracks
+app.config['TRACK_GATE_CHI2'] = 9.49  # Mahalanobis gate of that match, 95% for a 4-value box measurement
+app.config['TRACK_MAX_TRACKS'] = 1000
+app.config['TRACK_DROP_UNTRACKED'] = False  # leave low-confidence boxes without a track out of the counts
+
+# Compiled zone geometry kept per distinct zone set
+app.config['ZONE_SET_CACHE_SIZE'] = 64
+app.config['ZONE_SET_CACHE_MAX_BYTES'] = 256 * 1024 * 1024  # raster masks of all cached zone sets
+app.config['ZONE_GRID_CELL_SIZE'] = 64  # pixels per spatial index cell
+app.config['ZONE_MAX_COORDINATE'] = 16384  # zone points further out than any frame are rejected
+
+# Live heatmaps: 1/HEATMAP_GRID_SCALE resolution, older activity fades with the half-life
+app.config['HEATMAP_SIGMA'] = 30
+app.config['HEATMAP_GRID_SCALE'] = 8
+app.config['HEATMAP_HALF_LIFE_SEC'] = 300
+
+# Heatmap history: per-camera npz tiles every HEATMAP_BUCKET_MINUTES, rolled up into hours and days
+app.config['HEATMAP_HISTORY_ENABLED'] = True
+app.config['HEATMAP_HISTORY_DIR'] = 'heatmaps'
+app.config['HEATMAP_BUCKET_MINUTES'] = 5
+app.config['HEATMAP_HISTORY_MAX_WIDTH'] = 1920  # largest image /heatmap_history renders
+
+# Geometry-only responses (client draws overlays on a low-rate preview)
+app.config['PREVIEW_INTERVAL_MS'] = 1000
+app.config['PREVIEW_WIDTH'] = 480
+app.config['PREVIEW_QUALITY'] = 60
+
+# Server-side video analysis jobs
+app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['VIDEO_JOB_SAMPLE_FPS'] = 2.0
+app.config['VIDEO_JOB_MAX_MATCH_DISTANCE'] = 100  # Pixels a person may move between sampled frames
+app.config['VIDEO_JOB_RETENTION_SEC'] = 3600  # Finished jobs, their results and videos are dropped after this
+
+# Chunked, resumable video uploads
+app.config['UPLOAD_CHUNK_SIZE'] = 8 * 1024 * 1024  # Suggested client chunk size
+app.config['UPLOAD_BUFFER_SIZE'] = 1024 * 1024  # Bytes read from the request stream at a time
+app.config['UPLOAD_MAX_SIZE'] = 4 * 1024 * 1024 * 1024  # Largest video a client may declare
+app.config['UPLOAD_STALE_SEC'] = 3600  # Unfinished uploads with no new chunk for this long are removed
+app.config['UPLOAD_RETENTION_SEC'] = 24 * 3600  # Completed uploads are kept this long for video jobs
+
+# Detector configuration ('pytorch', 'onnx', 'onnx_int8' or 'openvino')
+app.config['DETECTOR_BACKEND'] = os.environ.get('DETECTOR_BACKEND', 'pytorch')
+app.config['MODEL_WEIGHTS'] = 'yolov8n.pt'
+app.config['MODEL_CACHE_DIR'] = 'models'
+app.config['CALIBRATION_DIR'] = 'uploads'
+app.config['CALIBRATION_MAX_FRAMES'] = 64
+
 # Database configuration
 DB_CONFIG = {
     'host': 'localhost',
@@ -37,6 +171,7 @@ DB_CONFIG = {
 
 # Global variables
 model = None
+model_backend = None
 video_capture = None
 uploaded_video_path = None
 crossing_line = None
@@ -52,16 +187,947 @@ zone_alerts = {}
 
 # Heatmap data
 heatmap_data = None
-heatmap_accumulator = None
 
 # Initialize YOLO model
+def export_model(weights, backend):
+    """Export weights to an ONNX/OpenVINO artifact once and return the cached path"""
+    cache_dir = app.config['MODEL_CACHE_DIR']
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    
+    if backend == 'onnx':
+        artifact = os.path.join(cache_dir, f'{stem}.onnx')
+    elif backend == 'onnx_int8':
+        artifact = os.path.join(cache_dir, f'{stem}_int8.onnx')
+    elif backend == 'openvino':
+        artifact = os.path.join(cache_dir, f'{stem}_openvino_model')
+    else:
+        raise ValueError(f'Unknown detector backend: {backend}')
+    
+    if os.path.exists(artifact):
+        return artifact
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    
+    if backend == 'onnx_int8':
+        quantize_model_int8(export_model(weights, 'onnx'), artifact)
+        return artifact
+    
+    # Dynamic axes keep batched inference working with the exported graph
+    exported = YOLO(weights).export(format=backend, dynamic=True, imgsz=640)
+    shutil.move(str(exported), artifact)
+    print(f"✅ Exported {weights} to {artifact}")
+    
+    return artifact
+
+def letterbox_tensor(img, size=640):
+    """Resize and pad a BGR frame the way YOLO does, returning a 1x3xHxW float tensor"""
+    height, width = img.shape[:2]
+    scale = min(size / height, size / width)
+    new_w, new_h = int(round(width * scale)), int(round(height * scale))
+    
+    resized = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(tensor[None])
+
+def load_calibration_frames(folder, max_frames=64, video_stride=15):
+    """Load sample images and every Nth video frame from a media folder"""
+    frames = []
+    image_exts = ('.jpg', '.jpeg', '.png', '.bmp')
+    video_exts = ('.mp4', '.webm', '.avi', '.mov', '.mkv')
+    
+    if not os.path.isdir(folder):
+        return frames
+    
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        ext = os.path.splitext(filename)[1].lower()
+        
+        if ext in image_exts:
+            img = cv2.imread(path)
+            if img is not None:
+                frames.append(img)
+        elif ext in video_exts:
+            cap = cv2.VideoCapture(path)
+            index = 0
+            while len(frames) < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if index % video_stride == 0:
+                    frames.append(frame)
+                index += 1
+            cap.release()
+        
+        if len(frames) >= max_frames:
+            break
+    
+    return frames[:max_frames]
+
+def quantize_model_int8(fp32_path, int8_path):
+    """Statically quantize an exported ONNX detector to INT8 using frames from CALIBRATION_DIR"""
+    import onnxruntime
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod,
+                                          QuantFormat, QuantType, quantize_static)
+    
+    frames = load_calibration_frames(app.config['CALIBRATION_DIR'], app.config['CALIBRATION_MAX_FRAMES'])
+    if not frames:
+        raise RuntimeError(f"No calibration media found in {app.config['CALIBRATION_DIR']}")
+    
+    import onnx
+    
+    input_name = onnxruntime.InferenceSession(
+        fp32_path, providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+    
+    # The Detect head is the last top-level module (/model.22/ for yolov8), keep its box decoding in FP32
+    node_names = [node.name for node in onnx.load(fp32_path).graph.node]
+    modules = [int(match.group(1)) for match in (re.match(r'/model\.(\d+)/', name) for name in node_names) if match]
+    head_prefix = f'/model.{max(modules)}/' if modules else None
+    head_nodes = [name for name in node_names if head_prefix and name.startswith(head_prefix)]
+    
+    class FrameCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self.tensors = iter([{input_name: letterbox_tensor(frame)} for frame in frames])
+        
+        def get_next(self):
+            return next(self.tensors, None)
+    
+    # Only backbone and neck convolutions are quantized, the detection head stays in FP32 to keep box accuracy
+    quantize_static(
+        fp32_path,
+        int8_path,
+        FrameCalibrationReader(),
+        quant_format=QuantFormat.QDQ,
+        op_types_to_quantize=['Conv'],
+        nodes_to_exclude=head_nodes,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        calibrate_method=CalibrationMethod.MinMax
+    )
+    print(f"✅ Quantized {fp32_path} to INT8 using {len(frames)} calibration frames, "
+          f"{len(head_nodes)} head nodes kept in FP32")
+
 def init_model():
-    global model
+    global model, model_backend
+    backend = app.config['DETECTOR_BACKEND']
+    weights = app.config['MODEL_WEIGHTS']
+    
     try:
-        model = YOLO('yolov8n.pt')
-        print("✅ YOLO model loaded successfully")
+        if backend == 'pytorch':
+            model = YOLO(weights)
+        else:
+            model = YOLO(export_model(weights, backend), task='detect')
+        model_backend = backend
+        print(f"✅ YOLO model loaded successfully ({backend} backend)")
     except Exception as e:
-        print(f"❌ Error loading YOLO model: {e}")
+        print(f"❌ Error loading YOLO model with {backend} backend: {e}")
+        
+        if backend != 'pytorch':
+            try:
+                model = YOLO(weights)
+                model_backend = 'pytorch'
+                print("✅ YOLO model loaded with pytorch backend instead")
+            except Exception as e:
+                print(f"❌ Error loading YOLO model: {e}")
+
+# Inference scheduler
+PERSON_CLASS = 0
+
+class InferenceBatcher:
+    """Collect frames from concurrent requests and run them as one batched forward pass"""
+    
+    def __init__(self, max_batch=8, max_wait_ms=10, timeout=30):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.requests = queue.Queue()
+        self.worker = None
+        self.lock = threading.Lock()
+        self.stats = {'batches': 0, 'frames': 0, 'largest_batch': 0}
+    
+    def start(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, daemon=True)
+                self.worker.start()
+    
+    def submit(self, img, **kwargs):
+        """Queue an image for inference and return a Future for its result"""
+        future = Future()
+        kwargs.setdefault('classes', [PERSON_CLASS])  # let the model drop other classes before NMS
+        self.start()
+        self.requests.put((img, kwargs, future))
+        return future
+    
+    def infer(self, img, **kwargs):
+        """Run inference on a single image, blocking until its batch is done"""
+        return self.submit(img, **kwargs).result(timeout=self.timeout)
+    
+    def _collect(self):
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            
+            # Requests with different model arguments cannot share a forward pass
+            groups = {}
+            for item in batch:
+                try:
+                    key = json.dumps(item[1], sort_keys=True)
+                except (TypeError, ValueError):
+                    key = repr(sorted(item[1].items(), key=lambda pair: pair[0]))
+                groups.setdefault(key, []).append(item)
+            
+            for items in groups.values():
+                futures = [future for _, _, future in items]
+                try:
+                    if model is None:
+                        raise RuntimeError('Model not loaded')
+                    
+                    images = [img for img, _, _ in items]
+                    results = model(images, verbose=False, **items[0][1])
+                    
+                    self.stats['batches'] += 1
+                    self.stats['frames'] += len(images)
+                    self.stats['largest_batch'] = max(self.stats['largest_batch'], len(images))
+                    
+                    for future, result in zip(futures, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for future in futures:
+                        future.set_exception(e)
+
+inference_batcher = InferenceBatcher(
+    max_batch=app.config['INFERENCE_MAX_BATCH'],
+    max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS'],
+    timeout=app.config['INFERENCE_TIMEOUT_SEC']
+)
+
+def run_inference(img, **kwargs):
+    """Run YOLO on one image through the shared batcher, returns a list like model(img)"""
+    return [inference_batcher.infer(img, **kwargs)]
+
+def person_boxes(results, offset=(0, 0)):
+    """Person rows of YOLO results as one (N, 6) array: x1, y1, x2, y2, confidence, class"""
+    # result.boxes.data comes to the host in one transfer instead of several per box
+    arrays = [result.boxes.data.cpu().numpy()[:, [0, 1, 2, 3, -2, -1]] for result in results if result.boxes is not None]
+    if not arrays:
+        return np.zeros((0, 6), dtype=np.float32)
+    
+    boxes = np.concatenate(arrays).astype(np.float32)
+    boxes = boxes[boxes[:, 5] == PERSON_CLASS]
+    boxes[:, :4] += np.array([offset[0], offset[1], offset[0], offset[1]], dtype=np.float32)
+    return boxes
+
+def box_centers(boxes):
+    """Integer centers of an (N, 4+) box array"""
+    return ((boxes[:, 0:2] + boxes[:, 2:4]) / 2).astype(np.int32)
+
+def detection_ids(boxes, track_ids=None):
+    """Track ids as a list, or 1..N when the boxes were not tracked"""
+    if track_ids is None:
+        return list(range(1, len(boxes) + 1))
+    return track_ids.tolist()
+
+def boxes_to_detections(boxes, track_ids=None):
+    """Detection dicts for the JSON schema, converted from the box array in bulk"""
+    corners = boxes[:, :4].astype(np.int32).tolist()
+    centers = box_centers(boxes).tolist()
+    confidences = boxes[:, 4].tolist()
+    
+    return [
+        {'id': track_id, 'bbox': bbox, 'center': center, 'confidence': confidence}
+        for track_id, bbox, center, confidence in zip(detection_ids(boxes, track_ids), corners, centers, confidences)
+    ]
+
+def inference_roi(frame_shape, zones, crossing_line=None, enabled=None):
+    """Bounding region of all zones and the crossing line, or None to use the full frame"""
+    if enabled is None:
+        enabled = app.config['ROI_INFERENCE_ENABLED']
+    if not enabled:
+        return None
+    
+    xs, ys = [], []
+    for zone_points in (zones or {}).values():
+        xs.extend(p['x'] for p in zone_points)
+        ys.extend(p['y'] for p in zone_points)
+    
+    if crossing_line:
+        for end in ('start', 'end'):
+            xs.append(crossing_line[end]['x'])
+            ys.append(crossing_line[end]['y'])
+    
+    if not xs:
+        return None
+    
+    height, width = frame_shape[:2]
+    margin = app.config['ROI_MARGIN']
+    x1, y1 = max(0, int(min(xs)) - margin), max(0, int(min(ys)) - margin)
+    x2, y2 = min(width, int(max(xs)) + margin), min(height, int(max(ys)) + margin)
+    
+    if x2 - x1 < 32 or y2 - y1 < 32:
+        return None
+    
+    if (x2 - x1) * (y2 - y1) > app.config['ROI_MAX_AREA_RATIO'] * width * height:
+        return None
+    
+    return [x1, y1, x2, y2]
+
+def detect_people(img, roi=None):
+    """Run the detector on an image (or just its ROI) and return the (N, 6) person box array"""
+    if roi is None:
+        return person_boxes(run_inference(img))
+    
+    # YOLO letterboxes the crop to its full input size, so small people get more pixels
+    x1, y1, x2, y2 = roi
+    crop = np.ascontiguousarray(img[y1:y2, x1:x2])
+    return person_boxes(run_inference(crop), offset=(x1, y1))
+
+def tile_windows(height, width, tile_size, overlap):
+    """Overlapping tile rectangles that cover the whole image"""
+    step = max(1, int(tile_size * (1 - overlap)))
+    
+    def starts(size):
+        if size <= tile_size:
+            return [0]
+        positions = list(range(0, size - tile_size, step))
+        positions.append(size - tile_size)
+        return positions
+    
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+def merge_tile_boxes(boxes, tiles, iou_threshold, ios_threshold):
+    """Cross-tile NMS on an (N, 6) box array, keeps the most confident box of each overlapping group
+    
+    tiles holds the tile index of each box; boxes from the same tile never suppress each other, so
+    an occluded person inside a neighbour's box that YOLO kept stays in.
+    """
+    if len(boxes) == 0:
+        return boxes
+    
+    scores = boxes[:, 4]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    
+    order = scores.argsort()[::-1]
+    keep = []
+    
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        
+        ix1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        iy1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        ix2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        iy2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+        
+        iou = inter / np.maximum(areas[best] + areas[rest] - inter, 1e-6)
+        ios = inter / np.maximum(np.minimum(areas[best], areas[rest]), 1e-6)
+        
+        duplicate = (tiles[rest] != tiles[best]) & ((iou > iou_threshold) | (ios > ios_threshold))
+        order = rest[~duplicate]
+    
+    return boxes[np.sort(keep)]
+
+def should_tile(img, requested=None):
+    """Tile when asked to, or automatically for large images"""
+    if requested is not None:
+        return bool(requested)
+    return max(img.shape[:2]) >= app.config['TILE_AUTO_MIN_SIDE']
+
+def detect_people_tiled(img, roi=None):
+    """Detect people in overlapping tiles run as one batch, returns (boxes, tile_count)"""
+    offset_x, offset_y = 0, 0
+    if roi is not None:
+        offset_x, offset_y = roi[0], roi[1]
+        img = img[roi[1]:roi[3], roi[0]:roi[2]]
+    
+    height, width = img.shape[:2]
+    windows = tile_windows(height, width, app.config['TILE_SIZE'], app.config['TILE_OVERLAP'])
+    
+    # Submitting every tile before waiting lets the batcher group them into forward passes
+    futures = [
+        inference_batcher.submit(np.ascontiguousarray(img[y1:y2, x1:x2]))
+        for x1, y1, x2, y2 in windows
+    ]
+    
+    # The tiles share one deadline, so a stuck worker fails the request like infer() does
+    deadline = time.monotonic() + inference_batcher.timeout
+    tile_boxes = [
+        person_boxes([future.result(timeout=max(0.0, deadline - time.monotonic()))],
+                     offset=(x1 + offset_x, y1 + offset_y))
+        for (x1, y1, _, _), future in zip(windows, futures)
+    ]
+    boxes = np.concatenate(tile_boxes)
+    tiles = np.repeat(np.arange(len(tile_boxes)), [len(b) for b in tile_boxes])
+    
+    merged = merge_tile_boxes(boxes, tiles, app.config['TILE_NMS_IOU'], app.config['TILE_NMS_IOS'])
+    return merged, len(windows)
+
+# Detection result cache
+class DetectionCache:
+    """LRU cache of detections keyed by image content and model settings, with an optional disk tier"""
+    
+    def __init__(self, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+    
+    def key(self, img, settings):
+        """Hash of the decoded pixels plus everything that changes the detector output"""
+        digest = hashlib.sha256()
+        digest.update(str(img.shape).encode())
+        digest.update(np.ascontiguousarray(img).data)
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+    
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+    
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return json.loads(self.entries[key])
+        
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key)) as f:
+                    entry = f.read()
+                self._remember(key, entry)
+                with self.lock:
+                    self.stats['disk_hits'] += 1
+                return json.loads(entry)
+            except (OSError, ValueError):
+                pass
+        
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+    
+    def put(self, key, value):
+        entry = json.dumps(value)
+        self._remember(key, entry)
+        
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), 'w') as f:
+                    f.write(entry)
+            except OSError as e:
+                print(f"❌ Could not write detection cache entry: {e}")
+    
+    def _remember(self, key, entry):
+        # Entries are stored serialised so callers can never mutate cached detections
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+detection_cache = DetectionCache(
+    max_entries=app.config['DETECTION_CACHE_SIZE'],
+    disk_dir=app.config['DETECTION_CACHE_DIR']
+)
+
+# Motion gating
+class MotionGate:
+    """Reuse the last detections while a camera shows a static scene"""
+    
+    def __init__(self, threshold=0.005, pixel_delta=25, max_skip=30, width=160):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_skip = max_skip
+        self.width = width
+        self.reference = None
+        self.boxes = np.zeros((0, 6), dtype=np.float32)
+        self.skipped_in_row = 0
+        self.lock = threading.Lock()
+        self.stats = {'inferences_run': 0, 'inferences_skipped': 0}
+    
+    def _signature(self, frame):
+        """Small blurred greyscale copy of the frame used for differencing"""
+        height, width = frame.shape[:2]
+        small_height = max(1, int(height * self.width / width))
+        small = cv2.resize(frame, (self.width, small_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+    
+    def _motion(self, signature):
+        """Fraction of pixels that changed since the last analysed frame"""
+        if self.reference is None or self.reference.shape != signature.shape:
+            return 1.0
+        diff = cv2.absdiff(signature, self.reference)
+        return np.count_nonzero(diff > self.pixel_delta) / diff.size
+    
+    def detect(self, frame, detect_fn):
+        """Return (boxes, skipped, motion) for a frame"""
+        signature = self._signature(frame)
+        
+        # Compare against the last analysed frame, not the previous one, so slow drift still triggers
+        with self.lock:
+            motion = self._motion(signature)
+            if motion < self.threshold and self.skipped_in_row < self.max_skip:
+                self.skipped_in_row += 1
+                self.stats['inferences_skipped'] += 1
+                return self.boxes.copy(), True, motion
+        
+        boxes = detect_fn(frame)
+        
+        with self.lock:
+            self.reference = signature
+            self.boxes = boxes.copy()
+            self.skipped_in_row = 0
+            self.stats['inferences_run'] += 1
+        
+        return boxes, False, motion
+
+motion_gates = {}
+
+def get_motion_gate(source):
+    if source not in motion_gates:
+        motion_gates[source] = MotionGate(
+            threshold=app.config['MOTION_THRESHOLD'],
+            pixel_delta=app.config['MOTION_PIXEL_DELTA'],
+            max_skip=app.config['MOTION_MAX_SKIP']
+        )
+    return motion_gates[source]
+
+# Keyframe propagation
+class KeyframePropagator:
+    """Run the detector on keyframes and move boxes with Lucas-Kanade optical flow in between"""
+    
+    def __init__(self, min_interval=2, max_interval=10, motion_scale=8.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.motion_scale = motion_scale
+        self.interval = max_interval
+        self.frames_since_keyframe = 0
+        self.prev_gray = None
+        self.boxes = np.zeros((0, 6), dtype=np.float32)
+        self.points = []
+        self.lock = threading.Lock()
+        self.stats = {'keyframes': 0, 'propagated': 0, 'interval': max_interval}
+    
+    def _features(self, gray, box):
+        """Pick corner points inside a box to follow between frames"""
+        height, width = gray.shape
+        x1, y1 = max(0, int(box[0])), max(0, int(box[1]))
+        x2, y2 = min(width, int(box[2])), min(height, int(box[3]))
+        
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            return None
+        
+        points = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], maxCorners=20, qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return None
+        
+        return points + np.array([x1, y1], dtype=np.float32)
+    
+    def _keyframe(self, gray, boxes):
+        self.boxes = boxes.copy()
+        self.points = [self._features(gray, box) for box in boxes]
+        self.prev_gray = gray
+        self.frames_since_keyframe = 0
+        self.stats['keyframes'] += 1
+    
+    def _propagate(self, gray):
+        """Shift every box by the median flow of its points, returns (boxes, motion, lost_ratio)"""
+        owners = []
+        points = []
+        for index, box_points in enumerate(self.points):
+            if box_points is not None:
+                points.append(box_points)
+                owners.extend([index] * len(box_points))
+        
+        if not points:
+            self.prev_gray = gray
+            return self.boxes.copy(), 0.0, 1.0
+        
+        # One pyramidal LK call for the points of all boxes
+        prev_points = np.concatenate(points).astype(np.float32)
+        next_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, prev_points, None, winSize=(15, 15), maxLevel=2
+        )
+        
+        owners = np.array(owners)
+        good = status.ravel() == 1
+        flow = (next_points - prev_points).reshape(-1, 2)
+        height, width = gray.shape
+        
+        lost = 0
+        for index in range(len(self.boxes)):
+            selected = good & (owners == index)
+            
+            if np.count_nonzero(selected) >= 2:
+                dx, dy = np.median(flow[selected], axis=0)
+                self.boxes[index, :4] += np.array([dx, dy, dx, dy], dtype=np.float32)
+                self.points[index] = next_points[selected]
+            else:
+                lost += 1
+                self.points[index] = None
+        
+        self.boxes[:, [0, 2]] = np.clip(self.boxes[:, [0, 2]], 0, width - 1)
+        self.boxes[:, [1, 3]] = np.clip(self.boxes[:, [1, 3]], 0, height - 1)
+        self.prev_gray = gray
+        motion = float(np.median(np.linalg.norm(flow[good], axis=1))) if good.any() else 0.0
+        
+        return self.boxes.copy(), motion, lost / len(self.boxes)
+    
+    def detect(self, frame, detect_fn):
+        """Return the box array for a frame, running detect_fn only on keyframes"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        
+        with self.lock:
+            # With nothing to follow, flow cannot notice people walking in, so every frame is a keyframe
+            needs_keyframe = (
+                self.prev_gray is None
+                or self.prev_gray.shape != gray.shape
+                or len(self.boxes) == 0
+                or self.frames_since_keyframe >= self.interval
+            )
+            
+            if not needs_keyframe:
+                boxes, motion, lost_ratio = self._propagate(gray)
+                self.frames_since_keyframe += 1
+                self.stats['propagated'] += 1
+                
+                # Fast scenes get more frequent keyframes, calm scenes fewer
+                interval = round(self.max_interval / (1 + motion / self.motion_scale))
+                self.interval = int(np.clip(interval, self.min_interval, self.max_interval))
+                self.stats['interval'] = self.interval
+                
+                # Most boxes lost their features, so the next frame must be a keyframe
+                if lost_ratio > 0.5:
+                    self.frames_since_keyframe = self.interval
+                
+                return boxes
+        
+        boxes = detect_fn(frame)
+        
+        with self.lock:
+            self._keyframe(gray, boxes)
+        
+        return boxes
+
+keyframe_propagators = {}
+
+def get_keyframe_propagator(source):
+    if source not in keyframe_propagators:
+        keyframe_propagators[source] = KeyframePropagator(
+            min_interval=app.config['KEYFRAME_MIN_INTERVAL'],
+            max_interval=app.config['KEYFRAME_MAX_INTERVAL'],
+            motion_scale=app.config['KEYFRAME_MOTION_SCALE']
+        )
+    return keyframe_propagators[source]
+
+# Multi-object tracking
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of (A, 4) and (B, 4) xyxy boxes"""
+    ix1 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    iy1 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    ix2 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    iy2 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+UNTRACKED_ID = 0  # id of a person box that belongs to no track
+
+class PersonTracker:
+    """SORT/ByteTrack style tracker: batched constant-velocity Kalman filters matched with Hungarian assignment"""
+    
+    # State per track: cx, cy, w, h and their velocities; all tracks are predicted and corrected as one array
+    F = np.eye(8) + np.eye(8, k=4)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.5, 0.5, 0.1, 0.1])
+    R = np.diag([4.0, 4.0, 16.0, 16.0])
+    P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1000.0, 1000.0, 1000.0, 1000.0])
+    INFEASIBLE = 1e6
+    
+    def __init__(self, max_age=30, iou_threshold=0.3, high_confidence=0.5, max_distance=100, gate_chi2=9.49,
+                 max_tracks=1000):
+        self.max_age = max_age
+        self.iou_threshold = iou_threshold
+        self.high_confidence = high_confidence
+        self.max_distance = max_distance
+        self.gate_chi2 = gate_chi2
+        self.max_tracks = max_tracks
+        self.lock = threading.Lock()
+        self.stats = {'frames': 0, 'tracks_started': 0, 'active_tracks': 0, 'untracked_low_confidence': 0}
+        self.reset()
+    
+    def reset(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.state = np.zeros((0, 8))
+        self.covariance = np.zeros((0, 8, 8))
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.sides = np.zeros(0, dtype=np.int8)
+        self.next_id = 1
+        self.last_frame_number = None
+        self.crossed_ids = set()
+    
+    def seek(self, frame_number):
+        """Start over when a video is rewound or restarted"""
+        if self.last_frame_number is not None and frame_number <= self.last_frame_number:
+            self.reset()
+        self.last_frame_number = frame_number
+    
+    def _predict(self):
+        self.state = self.state @ self.F.T
+        self.state[:, 2:4] = np.maximum(self.state[:, 2:4], 1.0)
+        self.covariance = self.F @ self.covariance @ self.F.T + self.Q
+    
+    def _correct(self, tracks, measurements):
+        if len(tracks) == 0:
+            return
+        
+        covariance = self.covariance[tracks]
+        gain = covariance[:, :, :4] @ np.linalg.inv(covariance[:, :4, :4] + self.R)
+        residual = measurements - self.state[tracks, :4]
+        
+        self.state[tracks] += (gain @ residual[:, :, None])[:, :, 0]
+        self.covariance[tracks] = covariance - gain @ covariance[:, :4, :]
+    
+    def _gated_distance(self, tracks, measurements):
+        """Squared Mahalanobis distance of each measurement from each track's predicted box,
+        infeasible where it is past the chi-square gate or max_distance pixels away"""
+        residual = measurements[None, :, :] - self.state[tracks, None, :4]
+        innovation = np.linalg.inv(self.covariance[tracks, :4, :4] + self.R)
+        cost = np.einsum('tdi,tij,tdj->td', residual, innovation, residual)
+        
+        pixels = np.linalg.norm(residual[:, :, :2], axis=2)
+        return np.where((cost <= self.gate_chi2) & (pixels <= self.max_distance), cost, self.INFEASIBLE)
+    
+    def _assign(self, cost, limit, tracks, dets):
+        """Hungarian assignment on a cost matrix, keeping pairs cheaper than limit"""
+        if len(tracks) == 0 or len(dets) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        rows, cols = linear_sum_assignment(cost)
+        keep = cost[rows, cols] <= limit
+        return tracks[rows[keep]], dets[cols[keep]]
+    
+    def update(self, detections, crossing_line=None):
+        """Track ids for an (N, 6) box array, recording line crossings
+        
+        Low-confidence boxes only continue existing tracks; those that match none get UNTRACKED_ID.
+        """
+        with self.lock:
+            self.stats['frames'] += 1
+            self._predict()
+            
+            boxes = detections[:, :4].astype(np.float64)
+            confidences = detections[:, 4].astype(np.float64)
+            measurements = np.column_stack([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]])
+            
+            predicted = np.column_stack([
+                self.state[:, :2] - self.state[:, 2:4] / 2,
+                self.state[:, :2] + self.state[:, 2:4] / 2
+            ])
+            assigned = np.full(len(detections), -1, dtype=np.int64)
+            free_tracks = np.arange(len(self.ids))
+            
+            # ByteTrack order: confident boxes claim tracks first, then the rest by IoU, then any
+            # box within the gate of a track's predicted position and size
+            high = confidences >= self.high_confidence
+            for candidates in (np.flatnonzero(high), np.flatnonzero(~high), None):
+                if candidates is None:
+                    candidates = np.flatnonzero(assigned < 0)
+                    cost = self._gated_distance(free_tracks, measurements[candidates])
+                    tracks, dets = self._assign(cost, self.gate_chi2, free_tracks, candidates)
+                else:
+                    iou = box_iou(predicted[free_tracks], boxes[candidates])
+                    tracks, dets = self._assign(1.0 - iou, 1.0 - self.iou_threshold, free_tracks, candidates)
+                
+                assigned[dets] = tracks
+                free_tracks = np.setdiff1d(free_tracks, tracks)
+            
+            matched = np.flatnonzero(assigned >= 0)
+            self._correct(assigned[matched], measurements[matched])
+            self.misses += 1
+            self.misses[assigned[matched]] = 0
+            
+            # Only confident unmatched boxes start tracks, the rest may be clutter and stay untracked
+            new = np.flatnonzero((assigned < 0) & high)
+            self.stats['untracked_low_confidence'] += int(np.count_nonzero((assigned < 0) & ~high))
+            if len(new):
+                new_state = np.zeros((len(new), 8))
+                new_state[:, :4] = measurements[new]
+                assigned[new] = np.arange(len(self.ids), len(self.ids) + len(new))
+                self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + len(new))])
+                self.state = np.concatenate([self.state, new_state])
+                self.covariance = np.concatenate([self.covariance, np.repeat(self.P0[None], len(new), axis=0)])
+                self.misses = np.concatenate([self.misses, np.zeros(len(new), dtype=np.int64)])
+                self.sides = np.concatenate([self.sides, np.zeros(len(new), dtype=np.int8)])
+                self.next_id += len(new)
+                self.stats['tracks_started'] += len(new)
+            
+            tracked = np.flatnonzero(assigned >= 0)
+            track_ids = np.full(len(detections), UNTRACKED_ID, dtype=np.int64)
+            track_ids[tracked] = self.ids[assigned[tracked]]
+            
+            # A track crosses when its center changes side of the line
+            if crossing_line and len(tracked):
+                x1, y1 = crossing_line['start']['x'], crossing_line['start']['y']
+                x2, y2 = crossing_line['end']['x'], crossing_line['end']['y']
+                cx, cy = measurements[tracked, 0], measurements[tracked, 1]
+                sides = np.sign((x2 - x1) * (cy - y1) - (y2 - y1) * (cx - x1)).astype(np.int8)
+                
+                rows = assigned[tracked]
+                previous = self.sides[rows]
+                crossed = (previous != 0) & (sides != 0) & (sides != previous)
+                self.crossed_ids.update(track_ids[tracked][crossed].tolist())
+                self.sides[rows] = np.where(sides != 0, sides, previous)
+            
+            # Lost tracks stay matchable for max_age frames, the oldest go first past max_tracks
+            keep = self.misses <= self.max_age
+            if np.count_nonzero(keep) > self.max_tracks:
+                candidates = np.flatnonzero(keep)
+                newest = candidates[np.argsort(self.misses[candidates], kind='stable')[:self.max_tracks]]
+                keep = np.zeros(len(keep), dtype=bool)
+                keep[newest] = True
+            self.ids, self.state, self.covariance = self.ids[keep], self.state[keep], self.covariance[keep]
+            self.misses, self.sides = self.misses[keep], self.sides[keep]
+            self.stats['active_tracks'] = len(self.ids)
+            
+            return track_ids
+
+def new_person_tracker(**overrides):
+    settings = {
+        'max_age': app.config['TRACK_MAX_AGE'],
+        'iou_threshold': app.config['TRACK_IOU_THRESHOLD'],
+        'high_confidence': app.config['TRACK_HIGH_CONFIDENCE'],
+        'max_distance': app.config['TRACK_MAX_DISTANCE'],
+        'gate_chi2': app.config['TRACK_GATE_CHI2'],
+        'max_tracks': app.config['TRACK_MAX_TRACKS']
+    }
+    settings.update(overrides)
+    return PersonTracker(**settings)
+
+person_trackers = {}
+
+def get_person_tracker(source):
+    if source not in person_trackers:
+        person_trackers[source] = new_person_tracker()
+    return person_trackers[source]
+
+def track_people(tracker, boxes, crossing_line=None):
+    """Run the tracker, returns (boxes, track_ids)
+    
+    Untracked low-confidence boxes are still people and stay in, unless TRACK_DROP_UNTRACKED is set.
+    """
+    track_ids = tracker.update(boxes, crossing_line)
+    if not app.config['TRACK_DROP_UNTRACKED']:
+        return boxes, track_ids
+    tracked = track_ids != UNTRACKED_ID
+    return boxes[tracked], track_ids[tracked]
+
+def detect_people_gated(frame, source, roi=None):
+    """Detect people unless the source's motion gate says the scene is unchanged"""
+    detect_fn = lambda img: detect_people(img, roi)
+    
+    if app.config['KEYFRAME_MODE_ENABLED']:
+        propagator = get_keyframe_propagator(source)
+        detect_fn = lambda img: propagator.detect(img, lambda keyframe: detect_people(keyframe, roi))
+    
+    if not app.config['MOTION_GATE_ENABLED']:
+        return detect_fn(frame), False, 1.0
+    return get_motion_gate(source).detect(frame, detect_fn)
+
+def draw_detections(frame, boxes, track_ids=None):
+    """Draw person boxes and labels on a frame"""
+    for (x1, y1, x2, y2), track_id in zip(boxes[:, :4].astype(np.int32).tolist(), detection_ids(boxes, track_ids)):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = "Person" if track_id == UNTRACKED_ID else f"Person {track_id}"
+        cv2.putText(frame, label, (x1, y1-10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+def annotate_frame(frame, boxes, track_ids, zones, crossing_line):
+    """Draw detections, zones and the crossing line on a frame"""
+    draw_detections(frame, boxes, track_ids)
+    
+    # Draw zones
+    if zones:
+        for zone_name, zone_points in zones.items():
+            points = np.array([[p['x'], p['y']] for p in zone_points], np.int32)
+            cv2.polylines(frame, [points], True, (0, 255, 0), 2)
+            cv2.putText(frame, zone_name, (points[0][0], points[0][1]-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    
+    # Draw crossing line
+    if crossing_line:
+        start = crossing_line['start']
+        end = crossing_line['end']
+        cv2.line(frame, (start['x'], start['y']), (end['x'], end['y']), (0, 0, 255), 3)
+    
+    return frame
+
+def encode_preview(frame):
+    """Small, low-quality JPEG of an unannotated frame"""
+    height, width = frame.shape[:2]
+    preview_width = min(width, app.config['PREVIEW_WIDTH'])
+    preview_height = max(1, int(height * preview_width / width))
+    small = cv2.resize(frame, (preview_width, preview_height), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, app.config['PREVIEW_QUALITY']])
+    return buffer.tobytes()
+
+# Latest low-rate preview per source: {'id', 'at', 'jpeg'}
+frame_previews = {}
+
+def update_preview(source, frame):
+    """Encode a new preview when the previous one is older than PREVIEW_INTERVAL_MS"""
+    previous = frame_previews.get(source)
+    now = time.time()
+    
+    if previous and (now - previous['at']) * 1000 < app.config['PREVIEW_INTERVAL_MS']:
+        return previous
+    
+    preview = {'id': (previous['id'] + 1) if previous else 1, 'at': now, 'jpeg': encode_preview(frame)}
+    frame_previews[source] = preview
+    return preview
+
+def geometry_response(result, frame_shape, preview, client_preview_id):
+    """Strip the annotated frame and attach the preview only when the client does not have it yet"""
+    result = {key: value for key, value in result.items() if key != 'frame'}
+    result['response_mode'] = 'geometry'
+    result['frame_size'] = [frame_shape[1], frame_shape[0]]
+    
+    if preview:
+        result['preview_id'] = preview['id']
+        if str(preview['id']) != str(client_preview_id):
+            result['preview'] = base64.b64encode(preview['jpeg']).decode('utf-8')
+    
+    return result
 
 # Database functions
 def get_db_connection():
@@ -152,6 +1218,28 @@ def admin_required(f):
     
     return decorated
 
+# Stream Authentication Decorator (<img> and EventSource cannot send headers)
+def stream_token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.args.get('token')
+        
+        if not token and 'Authorization' in request.headers:
+            parts = request.headers['Authorization'].split(' ')
+            token = parts[1] if len(parts) > 1 else None
+        
+        if not token:
+            return jsonify({'success': False, 'message': 'Token is missing'}), 401
+        
+        payload = verify_token(token)
+        if not payload:
+            return jsonify({'success': False, 'message': 'Token is invalid or expired'}), 401
+        
+        request.current_user = payload
+        return f(*args, **kwargs)
+    
+    return decorated
+
 # Authentication endpoints
 @app.route('/register', methods=['POST'])
 def register():
@@ -725,46 +1813,665 @@ def count_people_in_zones(detections, zones):
     
     return zone_counts
 
-def check_zone_alerts(zone_counts, thresholds):
-    """Check if any zone exceeds threshold and return alerts"""
-    alerts = []
-    
-    for zone_name, count in zone_counts.items():
-        if zone_name in thresholds:
-            threshold = thresholds[zone_name]
-            if count > threshold:
-                alerts.append({
-                    'zone': zone_name,
-                    'current': count,
-                    'threshold': threshold,
-                    'message': f'⚠️ {zone_name} exceeded threshold! ({count}/{threshold})',
-                    'severity': 'high' if count > threshold * 1.5 else 'medium'
-                })
-    
-    return alerts
+def zone_vertices(points):
+    """Zone points as an int32 vertex array for cv2, or None if it is not a polygon"""
+    if not points or len(points) < 3:
+        return None
+    return np.array([[round(point['x']), round(point['y'])] for point in points], dtype=np.int32)
 
-def generate_heatmap(frame, detections):
-    """Generate heatmap overlay for person detections"""
-    global heatmap_accumulator
-    
-    height, width = frame.shape[:2]
-    
-    if heatmap_accumulator is None:
-        heatmap_accumulator = np.zeros((height, width), dtype=np.float32)
+def points_in_polygon(points, vertices):
+    """point_in_polygon for an (N, 2) point array, vectorized over points and edges"""
+    x = points[:, 0:1].astype(np.float64)
+    y = points[:, 1:2].astype(np.float64)
+    x1, y1 = vertices[:, 0].astype(np.float64), vertices[:, 1].astype(np.float64)
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
     
-    for det in detections:
-        center_x, center_y = det['center']
-        y, x = np.ogrid[:height, :width]
-        mask = np.exp(-((x - center_x)**2 + (y - center_y)**2) / (2 * 30**2))
-        heatmap_accumulator += mask * 10
+    # Same edge rules as the scalar ray cast, so both give identical counts
+    spans = (y > np.minimum(y1, y2)) & (y <= np.maximum(y1, y2)) & (x <= np.maximum(x1, x2))
+    flat = y1 == y2
+    x_intersect = np.where(flat, x1, (y - y1) * (x2 - x1) / np.where(flat, 1.0, y2 - y1) + x1)
+    crossings = spans & ((x1 == x2) | (x <= x_intersect))
+    return np.count_nonzero(crossings, axis=1) % 2 == 1
+
+class ZoneGridIndex:
+    """Uniform grid over zone bounding boxes, exact polygon tests run only for candidate zones
     
-    heatmap_normalized = cv2.normalize(heatmap_accumulator, None, 0, 255, cv2.NORM_MINMAX)
-    heatmap_colored = cv2.applyColorMap(heatmap_normalized.astype(np.uint8), cv2.COLORMAP_JET)
+    The grid only covers the frame, so zones reaching far past it cost no more cells than the frame has.
+    """
     
-    overlay = cv2.addWeighted(frame, 0.7, heatmap_colored, 0.3, 0)
+    def __init__(self, vertices, bboxes, cell_size=64, frame_shape=None):
+        self.vertices = vertices
+        self.bboxes = bboxes
+        self.cell_size = cell_size
+        self.shape = tuple(frame_shape[:2]) if frame_shape is not None else None
+        self.cells = {}
+        
+        if self.shape is not None:
+            height, width = self.shape
+            last_x, last_y = max(width - 1, 0) // cell_size, max(height - 1, 0) // cell_size
+        
+        for index, (x1, y1, x2, y2) in enumerate(bboxes.tolist()):
+            if vertices[index] is None:
+                continue
+            x1, y1, x2, y2 = x1 // cell_size, y1 // cell_size, x2 // cell_size, y2 // cell_size
+            if self.shape is not None:
+                x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, last_x), min(y2, last_y)
+            for cx in range(x1, x2 + 1):
+                for cy in range(y1, y2 + 1):
+                    self.cells.setdefault((cx, cy), []).append(index)
     
-    return overlay
-
+    def count(self, centers, zone_total):
+        """People per zone index for an (N, 2) center array"""
+        totals = np.zeros(zone_total, dtype=np.int64)
+        if len(centers) == 0:
+            return totals
+        
+        candidates = {}
+        centers_in_grid = np.arange(len(centers))
+        
+        # Centers outside the gridded frame are checked against every zone's bounding box instead
+        if self.shape is not None:
+            height, width = self.shape
+            outside = (centers[:, 0] < 0) | (centers[:, 0] >= width) | (centers[:, 1] < 0) | (centers[:, 1] >= height)
+            if outside.any():
+                points = np.flatnonzero(outside)
+                x, y = centers[points, 0:1], centers[points, 1:2]
+                within = ((x >= self.bboxes[:, 0]) & (x <= self.bboxes[:, 2]) &
+                          (y >= self.bboxes[:, 1]) & (y <= self.bboxes[:, 3]))
+                for zone in np.flatnonzero(within.any(axis=0)).tolist():
+                    candidates[zone] = [points[within[:, zone]]]
+                centers_in_grid = np.flatnonzero(~outside)
+        
+        # Group the points by cell, then collect the points each zone has to test
+        if len(centers_in_grid) and self.cells:
+            cells = np.floor_divide(centers[centers_in_grid], self.cell_size)
+            unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind='stable')
+            groups = np.split(centers_in_grid[order], np.cumsum(np.bincount(inverse))[:-1])
+            
+            for (cx, cy), points in zip(unique_cells.tolist(), groups):
+                for zone in self.cells.get((cx, cy), ()):
+                    candidates.setdefault(zone, []).append(points)
+        
+        for zone, point_groups in candidates.items():
+            inside = points_in_polygon(centers[np.concatenate(point_groups)], self.vertices[zone])
+            totals[zone] = np.count_nonzero(inside)
+        
+        return totals
+
+class ZoneMask:
+    """Zones rasterized at frame resolution so counting is one gather of all centers plus a bincount"""
+    
+    BIT_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+    EDGE = np.iinfo(np.uint16).max  # label of pixels near a polygon edge, settled by the exact test
+    
+    def __init__(self, zone_set, frame_shape):
+        self.zone_set = zone_set
+        self.names = zone_set.names
+        self.shape = tuple(frame_shape[:2])
+        self.overlapping = False
+        self.bits = None
+        
+        height, width = self.shape
+        bit_dtype = next((dtype for dtype in self.BIT_DTYPES if len(self.names) <= np.iinfo(dtype).bits), None)
+        
+        # Each zone's bounding box plus the edge band, clipped to the frame
+        windows = {}
+        for index, vertices in enumerate(zone_set.vertices):
+            if vertices is None:
+                continue
+            x1, y1, x2, y2 = zone_set.bboxes[index].tolist()
+            x1, y1, x2, y2 = max(0, x1 - 1), max(0, y1 - 1), min(width, x2 + 2), min(height, y2 + 2)
+            if x1 < x2 and y1 < y2:
+                windows[index] = (x1, y1, x2, y2)
+        
+        # The masks only cover the area the zones span, the rest of the frame is in no zone
+        if windows:
+            boxes = np.array(list(windows.values()))
+            self.origin = (int(boxes[:, 0].min()), int(boxes[:, 1].min()))
+            self.size = (int(boxes[:, 2].max()) - self.origin[0], int(boxes[:, 3].max()) - self.origin[1])
+        else:
+            self.origin, self.size = (0, 0), (0, 0)
+        crop_shape = (self.size[1], self.size[0])
+        
+        # Label mask (0 = no zone) for disjoint zones, bitmask once two zones share a pixel
+        self.labels = np.zeros(crop_shape, dtype=np.uint16) if len(self.names) < self.EDGE else None
+        self.edges = np.zeros(crop_shape, dtype=bool)
+        
+        for index, (x1, y1, x2, y2) in windows.items():
+            if self.labels is None:
+                break
+            
+            window = (slice(y1 - self.origin[1], y2 - self.origin[1]), slice(x1 - self.origin[0], x2 - self.origin[0]))
+            
+            # fillPoly also fills boundary pixels, so a band around each edge is left to the exact
+            # ray cast; zones sharing an edge then neither overlap nor count a person twice
+            region = np.zeros((y2 - y1, x2 - x1), dtype=np.uint8)
+            local = zone_set.vertices[index] - np.array([x1, y1], dtype=np.int32)
+            cv2.fillPoly(region, [local], 1)
+            cv2.polylines(region, [local], True, 2, thickness=3)
+            self.edges[window] |= region == 2
+            inside = region == 1
+            
+            if not self.overlapping and self.labels[window][inside].any():
+                self.overlapping = True
+                if bit_dtype is None:
+                    # More overlapping zones than bits in a pixel, count with the spatial index
+                    self.labels = None
+                    break
+                
+                # Until now every pixel had at most one zone, so the labels convert straight to bits
+                shifts = np.maximum(self.labels, 1).astype(bit_dtype) - bit_dtype(1)
+                self.bits = np.where(self.labels > 0, np.left_shift(bit_dtype(1), shifts), 0).astype(bit_dtype)
+            
+            if self.bits is not None:
+                self.bits[window][inside] |= bit_dtype(1 << index)
+            else:
+                self.labels[window][inside] = index + 1
+        
+        if self.labels is not None and not self.overlapping:
+            self.labels[self.edges] = self.EDGE
+            self.edges = None
+        else:
+            self.labels = None
+            if self.bits is None:
+                self.edges = None
+    
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.labels, self.bits, self.edges) if array is not None)
+    
+    def count(self, centers):
+        """People per zone for an (N, 2) center array, keyed like the zones dict"""
+        if len(centers) == 0 or not self.names:
+            return dict.fromkeys(self.names, 0)
+        
+        if self.labels is None and self.bits is None:
+            totals = self.zone_set.grid(self.shape).count(centers, len(self.names))
+            return dict(zip(self.names, totals.tolist()))
+        
+        height, width = self.shape
+        visible = (centers[:, 0] >= 0) & (centers[:, 0] < width) & (centers[:, 1] >= 0) & (centers[:, 1] < height)
+        xs, ys = centers[:, 0] - self.origin[0], centers[:, 1] - self.origin[1]
+        covered = visible & (xs >= 0) & (xs < self.size[0]) & (ys >= 0) & (ys < self.size[1])
+        xs, ys = xs[covered], ys[covered]
+        
+        # Centers near an edge or outside the frame get the exact test
+        exact = ~visible
+        if self.bits is None:
+            values = self.labels[ys, xs]
+            near_edge = values == self.EDGE
+            totals = np.bincount(values[~near_edge], minlength=len(self.names) + 1)[1:len(self.names) + 1]
+        else:
+            near_edge = self.edges[ys, xs]
+            values = self.bits[ys[~near_edge], xs[~near_edge]]
+            shifts = np.arange(len(self.names), dtype=values.dtype)
+            totals = ((values[:, None] >> shifts) & 1).sum(axis=0)
+        exact[np.flatnonzero(covered)[near_edge]] = True
+        
+        if exact.any():
+            totals = totals + self.zone_set.grid(self.shape).count(centers[exact], len(self.names))
+        
+        return dict(zip(self.names, totals.tolist()))
+
+class ZoneSet:
+    """Parsed geometry of one zone set: vertex arrays, bounding boxes and raster masks per frame size"""
+    
+    MAX_MASKS = 4
+    
+    def __init__(self, zone_set_id, zones):
+        self.zone_set_id = zone_set_id
+        self.zones = {name: list(points) for name, points in zones.items()}
+        self.names = list(self.zones)
+        self.vertices = [zone_vertices(points) for points in self.zones.values()]
+        
+        limit = app.config['ZONE_MAX_COORDINATE']
+        for name, vertices in zip(self.names, self.vertices):
+            if vertices is not None and np.abs(vertices).max() > limit:
+                raise InvalidZones(f'Zone {name} has points beyond {limit}px, far outside any frame')
+        
+        self.bboxes = np.array([
+            [v[:, 0].min(), v[:, 1].min(), v[:, 0].max(), v[:, 1].max()] if v is not None else [0, 0, -1, -1]
+            for v in self.vertices
+        ], dtype=np.int32).reshape(-1, 4)
+        self.masks = OrderedDict()
+        self.grids = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def grid(self, frame_shape):
+        """Spatial index clipped to the frame size"""
+        shape = tuple(frame_shape[:2])
+        with self.lock:
+            if shape not in self.grids:
+                if len(self.grids) >= self.MAX_MASKS:
+                    self.grids.popitem(last=False)
+                self.grids[shape] = ZoneGridIndex(self.vertices, self.bboxes, app.config['ZONE_GRID_CELL_SIZE'], shape)
+            return self.grids[shape]
+    
+    def mask(self, frame_shape):
+        shape = tuple(frame_shape[:2])
+        with self.lock:
+            if shape not in self.masks:
+                if len(self.masks) >= self.MAX_MASKS:
+                    self.masks.popitem(last=False)
+                self.masks[shape] = ZoneMask(self, shape)
+            return self.masks[shape]
+    
+    @property
+    def nbytes(self):
+        with self.lock:
+            return sum(mask.nbytes for mask in self.masks.values())
+    
+    def count(self, centers, frame_shape, rasterize=True):
+        """People per zone; one-off counts use the grid index unless a mask for the frame size exists"""
+        if not rasterize:
+            with self.lock:
+                mask = self.masks.get(tuple(frame_shape[:2]))
+            if mask is None:
+                return dict(zip(self.names, self.grid(frame_shape).count(centers, len(self.names)).tolist()))
+            return mask.count(centers)
+        return self.mask(frame_shape).count(centers)
+
+class UnknownZoneSet(Exception):
+    pass
+
+class InvalidZones(ValueError):
+    pass
+
+class ZoneSetCache:
+    """LRU of compiled zone sets per user, keyed by a hash of their geometry and bounded by mask memory"""
+    
+    def __init__(self, max_entries=64, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'compiled': 0, 'evicted': 0}
+    
+    def key(self, zones):
+        encoded = json.dumps(zones, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+    
+    def nbytes(self):
+        with self.lock:
+            zone_sets = list(self.entries.values())
+        return sum(zone_set.nbytes for zone_set in zone_sets)
+    
+    def _trim(self):
+        # Masks are built after a set is cached, so memory is rechecked on every lookup
+        sizes = {key: zone_set.nbytes for key, zone_set in self.entries.items()}
+        total = sum(sizes.values())
+        while len(self.entries) > self.max_entries or (len(self.entries) > 1 and total > self.max_bytes):
+            key, _ = self.entries.popitem(last=False)
+            total -= sizes[key]
+            self.stats['evicted'] += 1
+    
+    def get(self, zone_set_id, owner=None):
+        """A zone set the same user compiled earlier, ids from other users are never found"""
+        with self.lock:
+            self._trim()
+            zone_set = self.entries.get((owner, zone_set_id))
+            if zone_set is None:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end((owner, zone_set_id))
+            self.stats['hits'] += 1
+            return zone_set
+    
+    def compile(self, zones, owner=None):
+        """Compiled geometry for a zones dict, reusing an earlier compile of the same shapes"""
+        zone_set_id = self.key(zones)
+        zone_set = self.get(zone_set_id, owner)
+        if zone_set is not None:
+            return zone_set
+        
+        zone_set = ZoneSet(zone_set_id, zones)
+        with self.lock:
+            self.entries[(owner, zone_set_id)] = zone_set
+            self.stats['compiled'] += 1
+            self._trim()
+        return zone_set
+
+zone_set_cache = ZoneSetCache(app.config['ZONE_SET_CACHE_SIZE'], app.config['ZONE_SET_CACHE_MAX_BYTES'])
+
+def compile_zones(zones, owner=None):
+    """ZoneSet for a zones dict (an already compiled ZoneSet is passed through), None without zones"""
+    if isinstance(zones, ZoneSet):
+        return zones
+    if not zones:
+        return None
+    return zone_set_cache.compile(zones, owner)
+
+def resolve_zone_set(zones, zone_set_id=None, owner=None):
+    """Zones sent in the request, or the cached set the same user refers to by zone_set_id"""
+    if zones:
+        return compile_zones(zones, owner)
+    if not zone_set_id:
+        return None
+    
+    zone_set = zone_set_cache.get(zone_set_id, owner)
+    if zone_set is None:
+        raise UnknownZoneSet(zone_set_id)
+    return zone_set
+
+def count_zone_occupancy(boxes, zones, frame_shape, rasterize=True):
+    """Count people per zone with the compiled zone mask (rasterize=False for single images)"""
+    zone_set = compile_zones(zones)
+    if zone_set is None:
+        return {}
+    return zone_set.count(box_centers(boxes), frame_shape, rasterize)
+
+def unknown_zone_set_response(zone_set_id):
+    return jsonify({
+        'success': False,
+        'message': f'Unknown zone_set_id {zone_set_id}, send the zones again',
+        'error': 'unknown_zone_set'
+    }), 400
+
+def check_zone_alerts(zone_counts, thresholds):
+    """Check if any zone exceeds threshold and return alerts"""
+    alerts = []
+    
+    for zone_name, count in zone_counts.items():
+        if zone_name in thresholds:
+            threshold = thresholds[zone_name]
+            if count > threshold:
+                alerts.append({
+                    'zone': zone_name,
+                    'current': count,
+                    'threshold': threshold,
+                    'message': f'⚠️ {zone_name} exceeded threshold! ({count}/{threshold})',
+                    'severity': 'high' if count > threshold * 1.5 else 'medium'
+                })
+    
+    return alerts
+
+def grid_indices(grid_shape, frame_shape, centers):
+    """(rows, cols) of the grid cells under frame-coordinate centers, dropping any outside the frame"""
+    # Centers map proportionally onto the fixed grid, so a resolution change keeps the history
+    grid_height, grid_width = grid_shape
+    height, width = frame_shape[:2]
+    xs = centers[:, 0].astype(np.int64) * grid_width // width
+    ys = centers[:, 1].astype(np.int64) * grid_height // height
+    inside = (xs >= 0) & (xs < grid_width) & (ys >= 0) & (ys < grid_height)
+    return ys[inside], xs[inside]
+
+def colorize_heatmap(density, size):
+    """Normalized, colour-mapped density resized to size (width, height)"""
+    heatmap_normalized = cv2.normalize(density, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    if heatmap_normalized.shape[::-1] != tuple(size):
+        heatmap_normalized = cv2.resize(heatmap_normalized, tuple(size), interpolation=cv2.INTER_LINEAR)
+    return cv2.applyColorMap(heatmap_normalized, cv2.COLORMAP_JET)
+
+class HeatmapAccumulator:
+    """Person density heatmap on a grid `scale` times smaller than the frame, optionally fading with a half-life"""
+    
+    def __init__(self, sigma=30, peak=10, scale=1, half_life=None):
+        self.scale = max(1, int(scale))
+        self.sigma = sigma / self.scale
+        # A normalized Gaussian spreads the impulse, so scale it to keep the old peak of `peak` per person
+        self.impulse = peak * 2 * np.pi * self.sigma ** 2
+        self.half_life = half_life
+        self.grid = None
+        self.updated_at = None
+        self.lock = threading.Lock()
+    
+    def _decay(self, now):
+        if self.half_life and self.updated_at is not None:
+            self.grid *= 0.5 ** ((now - self.updated_at) / self.half_life)
+        self.updated_at = now
+    
+    def add(self, frame_shape, centers, now=None):
+        """Scatter-add (N, 2) person centers given in frame coordinates"""
+        height, width = frame_shape[:2]
+        
+        with self.lock:
+            if self.grid is None:
+                self.grid = np.zeros((-(-height // self.scale), -(-width // self.scale)), dtype=np.float32)
+            self._decay(time.time() if now is None else now)
+            
+            np.add.at(self.grid, grid_indices(self.grid.shape, frame_shape, centers), self.impulse)
+        return self
+    
+    def density(self):
+        """Sum of a Gaussian per person, i.e. what the per-detection exp() loop used to build"""
+        with self.lock:
+            if self.grid is None:
+                return None
+            self._decay(time.time())
+            return cv2.GaussianBlur(self.grid, (0, 0), self.sigma, borderType=cv2.BORDER_CONSTANT)
+    
+    def colored(self, size):
+        """Colour-mapped density upsampled to size (width, height)"""
+        density = self.density()
+        if density is None:
+            return None
+        return colorize_heatmap(density, size)
+    
+    def render(self, frame):
+        """Colour-mapped density blended over the frame"""
+        heatmap_colored = self.colored((frame.shape[1], frame.shape[0]))
+        if heatmap_colored is None:
+            return frame
+        
+        return cv2.addWeighted(frame, 0.7, heatmap_colored, 0.3, 0)
+
+# Running heatmap per camera: coarse grid, constant memory, shows the last few half-lives
+heatmaps = {}
+
+def get_heatmap(source):
+    if source not in heatmaps:
+        heatmaps[source] = HeatmapAccumulator(
+            sigma=app.config['HEATMAP_SIGMA'],
+            scale=app.config['HEATMAP_GRID_SCALE'],
+            half_life=app.config['HEATMAP_HALF_LIFE_SEC']
+        )
+    return heatmaps[source]
+
+class HeatmapHistory:
+    """Time-bucketed person-frame counts of one camera, persisted as npz tiles with hourly and daily rollups"""
+    
+    LEVELS = {'bucket': '%Y%m%d-%H%M', 'hour': '%Y%m%d-%H', 'day': '%Y%m%d'}
+    
+    def __init__(self, folder, scale=8, bucket_minutes=5):
+        self.folder = folder
+        self.scale = max(1, int(scale))
+        self.bucket_minutes = bucket_minutes
+        self.grid = None
+        self.frames = 0
+        self.bucket_start = None
+        self.lock = threading.Lock()
+    
+    def bucket_of(self, moment):
+        return moment.replace(minute=moment.minute - moment.minute % self.bucket_minutes, second=0, microsecond=0)
+    
+    def level_start(self, level, moment):
+        if level == 'day':
+            return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        if level == 'hour':
+            return moment.replace(minute=0, second=0, microsecond=0)
+        return self.bucket_of(moment)
+    
+    def _path(self, level, moment):
+        return os.path.join(self.folder, level, moment.strftime(self.LEVELS[level]) + '.npz')
+    
+    def _load(self, path):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as tile:
+            return tile['grid'], int(tile['frames'])
+    
+    def add(self, frame_shape, centers, moment=None):
+        """Count centers into the current bucket, writing out the previous bucket when it has ended"""
+        moment = moment or datetime.now()
+        bucket = self.bucket_of(moment)
+        height, width = frame_shape[:2]
+        
+        with self.lock:
+            if self.bucket_start is not None and bucket != self.bucket_start:
+                self._flush()
+            self.bucket_start = bucket
+            
+            if self.grid is None:
+                self.grid = np.zeros((-(-height // self.scale), -(-width // self.scale)), dtype=np.float32)
+            np.add.at(self.grid, grid_indices(self.grid.shape, frame_shape, centers), 1.0)
+            self.frames += 1
+    
+    def flush(self):
+        with self.lock:
+            self._flush()
+    
+    def _flush(self):
+        """Add the unsaved counts into the bucket, hour and day tiles, then start counting from zero"""
+        if self.grid is None or not self.frames:
+            return
+        
+        for level in self.LEVELS:
+            path = self._path(level, self.level_start(level, self.bucket_start))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            
+            grid, frames = self.grid, self.frames
+            existing = self._load(path)
+            if existing is not None:
+                grid = resize_heatmap_grid(existing[0], self.grid.shape) + self.grid
+                frames += existing[1]
+            
+            # Write then rename, so a crash never leaves a half-written tile
+            temp_path = path[:-len('.npz')] + '.tmp.npz'
+            np.savez_compressed(temp_path, grid=grid, frames=frames)
+            os.replace(temp_path, path)
+        
+        self.grid[:] = 0
+        self.frames = 0
+    
+    def span(self):
+        """(first, last) day holding tiles on disk or unsaved counts, None when nothing was recorded"""
+        days = []
+        try:
+            names = os.listdir(os.path.join(self.folder, 'day'))
+        except FileNotFoundError:
+            names = []
+        
+        for name in names:
+            try:
+                days.append(datetime.strptime(name[:-len('.npz')], self.LEVELS['day']))
+            except ValueError:
+                continue  # temp files of an interrupted write
+        
+        with self.lock:
+            if self.frames:
+                days.append(self.level_start('day', self.bucket_start))
+        
+        return (min(days), max(days)) if days else None
+    
+    def tiles(self, start, end):
+        """Cover [start, end) with the fewest day, hour and bucket tiles, rounded out to whole buckets"""
+        moment = self.bucket_of(start)
+        tiles = []
+        
+        while moment < end:
+            if moment == self.level_start('day', moment) and moment + timedelta(days=1) <= end:
+                tiles.append(('day', moment))
+                moment += timedelta(days=1)
+            elif moment == self.level_start('hour', moment) and moment + timedelta(hours=1) <= end:
+                tiles.append(('hour', moment))
+                moment += timedelta(hours=1)
+            else:
+                tiles.append(('bucket', moment))
+                moment += timedelta(minutes=self.bucket_minutes)
+        
+        return tiles
+    
+    def query(self, start, end):
+        """Summed (grid, frames, tiles_read) over [start, end), including counts not yet written out"""
+        total, frames, tiles_read = None, 0, 0
+        
+        # Only walk the days something was recorded on, however wide the requested range is
+        span = self.span()
+        if span is None:
+            return total, frames, tiles_read
+        start, end = max(start, span[0]), min(end, span[1] + timedelta(days=1))
+        
+        for level, moment in self.tiles(start, end):
+            tile = self._load(self._path(level, moment))
+            if tile is None:
+                continue
+            
+            grid, tile_frames = tile
+            total = grid.copy() if total is None else total + resize_heatmap_grid(grid, total.shape)
+            frames += tile_frames
+            tiles_read += 1
+        
+        with self.lock:
+            if self.frames and self.bucket_of(start) <= self.bucket_start < end:
+                total = self.grid.copy() if total is None else total + resize_heatmap_grid(self.grid, total.shape)
+                frames += self.frames
+        
+        return total, frames, tiles_read
+
+def resize_heatmap_grid(grid, shape):
+    """Resample a count grid to another grid shape, keeping its total"""
+    if grid.shape == tuple(shape):
+        return grid
+    resized = cv2.resize(grid, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+    return resized * (grid.sum() / max(resized.sum(), 1e-6))
+
+heatmap_histories = {}
+
+def heatmap_history_folder(source):
+    return os.path.join(app.config['HEATMAP_HISTORY_DIR'], source.replace(':', '_'))
+
+def get_heatmap_history(source):
+    if source not in heatmap_histories:
+        heatmap_histories[source] = HeatmapHistory(
+            heatmap_history_folder(source),
+            scale=app.config['HEATMAP_GRID_SCALE'],
+            bucket_minutes=app.config['HEATMAP_BUCKET_MINUTES']
+        )
+    return heatmap_histories[source]
+
+def flush_heatmap_histories():
+    for history in list(heatmap_histories.values()):
+        try:
+            history.flush()
+        except Exception as e:
+            print(f"❌ Heatmap history flush error: {e}")
+
+atexit.register(flush_heatmap_histories)
+
+def record_heatmap(source, frame_shape, boxes, live=False):
+    """Add detections to the camera's history and, when shown, its live decaying heatmap"""
+    centers = box_centers(boxes)
+    
+    if live:
+        get_heatmap(source).add(frame_shape, centers)
+    if app.config['HEATMAP_HISTORY_ENABLED']:
+        get_heatmap_history(source).add(frame_shape, centers)
+
+def generate_heatmap(frame, boxes, source='webcam'):
+    """Generate heatmap overlay for person detections"""
+    heatmap = get_heatmap(source)
+    heatmap.add(frame.shape, box_centers(boxes))
+    
+    return heatmap.render(frame)
+
+def encode_heatmap(source, frame_shape):
+    """JPEG of a source's colour-mapped heatmap at preview width, None before anything was added"""
+    if source not in heatmaps:
+        return None
+    
+    height, width = frame_shape[:2]
+    preview_width = min(width, app.config['PREVIEW_WIDTH'])
+    size = (preview_width, max(1, int(height * preview_width / width)))
+    
+    heatmap_colored = heatmaps[source].colored(size)
+    if heatmap_colored is None:
+        return None
+    
+    _, buffer = cv2.imencode('.jpg', heatmap_colored, [cv2.IMWRITE_JPEG_QUALITY, app.config['PREVIEW_QUALITY']])
+    return base64.b64encode(buffer).decode('utf-8')
+
 # [Keep all existing endpoints from original code - analyze_image, webcam, video, etc.]
 # Adding remaining essential endpoints for completeness
 
@@ -890,90 +2597,267 @@ def get_analytics():
 
 @app.route('/test', methods=['GET'])
 def test():
-    return jsonify({'message': 'Backend is running!', 'model_loaded': model is not None}), 200
+    return jsonify({
+        'message': 'Backend is running!',
+        'model_loaded': model is not None,
+        'detector_backend': model_backend
+    }), 200
 
 
 # ==================== IMAGE & VIDEO ANALYSIS ENDPOINTS ====================
 # ADD THESE NEW ENDPOINTS HERE
 
+def decode_image_data(image_data):
+    """Decode a base64 string or data URL into a BGR image"""
+    # Remove base64 prefix
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+    
+    image_bytes = base64.b64decode(image_data)
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+def read_binary_image(field):
+    """Decode an image sent as the raw request body or as a multipart file field"""
+    if request.files and field in request.files:
+        buffer = request.files[field].read()
+    else:
+        buffer = request.stream.read()
+    
+    if not buffer:
+        return None
+    
+    return cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+
+def parse_compact_zones(value):
+    """Zones as JSON, either {name: [x1, y1, x2, y2, ...]} or {name: [{x, y}, ...]}"""
+    if not value:
+        return {}
+    
+    try:
+        zones = {}
+        for zone_name, points in json.loads(value).items():
+            if points and isinstance(points[0], dict):
+                zones[zone_name] = [{'x': int(point['x']), 'y': int(point['y'])} for point in points]
+            else:
+                zones[zone_name] = [
+                    {'x': int(points[i]), 'y': int(points[i + 1])}
+                    for i in range(0, len(points) - 1, 2)
+                ]
+        return zones
+    except (ValueError, TypeError, AttributeError, KeyError, IndexError):
+        raise ValueError('Malformed zones parameter, expected {"name": [x1, y1, x2, y2, ...]}')
+
+def parse_compact_line(value):
+    """Crossing line as 'x1,y1,x2,y2'"""
+    if not value:
+        return None
+    
+    try:
+        x1, y1, x2, y2 = [int(float(v)) for v in value.split(',')]
+    except ValueError:
+        raise ValueError('Malformed line parameter, expected x1,y1,x2,y2')
+    return {'start': {'x': x1, 'y': y1}, 'end': {'x': x2, 'y': y2}}
+
+def parse_optional_flag(value):
+    if value is None or value == '':
+        return None
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def analyze_image_array(img, zones, options):
+    """Shared analysis for JSON and binary image uploads"""
+    zone_set = compile_zones(zones)
+    zones = zone_set.zones if zone_set else {}
+    
+    # Run YOLO detection
+    roi = inference_roi(img.shape, zones, enabled=options.get('roi_inference'))
+    tiled = should_tile(img, options.get('tiled'))
+    
+    # Re-submitted images reuse their detections, zones and alerts are recomputed below
+    cache_key = detection_cache.key(img, {
+        'weights': app.config['MODEL_WEIGHTS'],
+        'backend': model_backend,
+        'roi': roi,
+        'tiled': tiled,
+        'tile_size': app.config['TILE_SIZE'],
+        'tile_overlap': app.config['TILE_OVERLAP'],
+        'format': 'boxes'
+    })
+    cached = detection_cache.get(cache_key)
+    cache_hit = cached is not None
+    
+    if cache_hit:
+        boxes, tiles = np.array(cached['boxes'], dtype=np.float32).reshape(-1, 6), cached['tiles']
+    else:
+        tiles = 1
+        if tiled:
+            boxes, tiles = detect_people_tiled(img, roi)
+        else:
+            boxes = detect_people(img, roi)
+        detection_cache.put(cache_key, {'boxes': boxes.tolist(), 'tiles': tiles})
+    people_count = len(boxes)
+    
+    # Count people in zones and check for alerts, a mask would cost more to build than it saves here
+    zone_counts = count_zone_occupancy(boxes, zone_set, img.shape, rasterize=False)
+    alerts = check_zone_alerts(zone_counts, zone_thresholds)
+    
+    result = {
+        'success': True,
+        'people_count': people_count,
+        'boxes': boxes,
+        'zone_counts': zone_counts,
+        'zone_set_id': zone_set.zone_set_id if zone_set else None,
+        'alerts': alerts,
+        'inference_roi': roi,
+        'tiles': tiles,
+        'cache_hit': cache_hit
+    }
+    
+    # Density of this image only, the webcam keeps its own running heatmap
+    if options.get('enable_heatmap') and len(boxes):
+        overlay = HeatmapAccumulator().add(img.shape, box_centers(boxes)).render(img)
+        _, buffer = cv2.imencode('.jpg', overlay)
+        result['heatmap'] = base64.b64encode(buffer).decode('utf-8')
+    
+    return result
+
+def analyze_frame_array(img, zones, crossing_line, options, source):
+    """Shared analysis for JSON and binary video frames"""
+    zone_set = compile_zones(zones)
+    zones = zone_set.zones if zone_set else {}
+    
+    # Run YOLO detection (skipped when the video shows a static scene)
+    roi = inference_roi(img.shape, zones, crossing_line, options.get('roi_inference'))
+    boxes, inference_skipped, motion = detect_people_gated(img, source, roi)
+    
+    # Stable ids and line crossings across frames of this video
+    tracker = get_person_tracker(source)
+    if options.get('frame_number') not in (None, ''):
+        tracker.seek(int(float(options['frame_number'])))
+    boxes, track_ids = track_people(tracker, boxes, crossing_line)
+    people_count = len(boxes)
+    
+    # Count zone occupancy
+    zone_counts = count_zone_occupancy(boxes, zone_set, img.shape)
+    
+    return {
+        'success': True,
+        'people_count': people_count,
+        'boxes': boxes,
+        'track_ids': track_ids,
+        'zone_counts': zone_counts,
+        'zone_set_id': zone_set.zone_set_id if zone_set else None,
+        'crossed_count': len(tracker.crossed_ids),
+        'inference_skipped': inference_skipped,
+        'motion': round(motion, 4),
+        'inference_roi': roi
+    }
+
+# Response formats negotiated via the Accept header; plain JSON keeps the original schema
+COLUMNAR_JSON_MIMETYPE = 'application/vnd.crowdcount.columnar+json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+def columnar_detections(boxes, track_ids=None):
+    """Flat arrays instead of one dict per person: boxes are [x1, y1, x2, y2, ...], centers [x, y, ...]"""
+    return {
+        'ids': detection_ids(boxes, track_ids),
+        'boxes': boxes[:, :4].astype(np.int32).ravel().tolist(),
+        'centers': box_centers(boxes).ravel().tolist(),
+        'confidences': np.round(boxes[:, 4].astype(np.float64), 4).tolist()
+    }
+
+def detection_fields(result, columnar=False):
+    """Swap a result's internal box and track id arrays for the detections of the response schema"""
+    result = dict(result)
+    boxes = result.pop('boxes')
+    track_ids = result.pop('track_ids', None)
+    
+    if columnar:
+        result['detections'] = columnar_detections(boxes, track_ids)
+        result['detections_format'] = 'columnar'
+    else:
+        result['detections'] = boxes_to_detections(boxes, track_ids)
+    return result
+
+def msgpack_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f'Cannot serialize {type(obj).__name__}')
+
+def detection_response(payload, code=200):
+    """jsonify a detection result, or its columnar JSON / msgpack form when the client asks for it"""
+    offered = ['application/json', COLUMNAR_JSON_MIMETYPE]
+    if msgpack:
+        offered.append(MSGPACK_MIMETYPE)
+    mimetype = request.accept_mimetypes.best_match(offered) or 'application/json'
+    
+    if 'boxes' in payload:
+        payload = detection_fields(payload, columnar=mimetype != 'application/json')
+    
+    if mimetype == 'application/json' or 'detections' not in payload:
+        response = jsonify(payload)
+    elif mimetype == MSGPACK_MIMETYPE:
+        response = Response(msgpack.packb(payload, default=msgpack_default, use_bin_type=True), mimetype=mimetype)
+    else:
+        response = jsonify(payload)
+        response.mimetype = mimetype
+    
+    response.vary.add('Accept')
+    return response, code
+
 @app.route('/analyze_image', methods=['POST'])
 @token_required
 def analyze_image():
     """Analyze uploaded image"""
     data = request.get_json()
     image_data = data.get('image')
-    zones = data.get('zones', {})
     
     if not image_data:
         return jsonify({'success': False, 'message': 'No image provided'}), 400
     
     try:
-        # Remove base64 prefix
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        # Decode image
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Run YOLO detection
-        results = model(img)
-        
-        detections = []
-        people_count = 0
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                if cls == 0:  # Person class
-                    people_count += 1
-                    bbox = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = bbox
-                    center_x = int((x1 + x2) / 2)
-                    center_y = int((y1 + y2) / 2)
-                    
-                    detections.append({
-                        'id': people_count,
-                        'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                        'center': [center_x, center_y],
-                        'confidence': float(box.conf[0])
-                    })
-        
-        # Count people in zones
-        zone_counts = {}
-        if zones:
-            for zone_name, zone_points in zones.items():
-                count = 0
-                for det in detections:
-                    center_x, center_y = det['center']
-                    if point_in_polygon(center_x, center_y, zone_points):
-                        count += 1
-                zone_counts[zone_name] = count
+        zones = resolve_zone_set(data.get('zones'), data.get('zone_set_id'), request.current_user['user_id'])
+        img = decode_image_data(image_data)
+        return detection_response(analyze_image_array(img, zones, data))
         
-        # Check for alerts
-        alerts = []
-        for zone_name, count in zone_counts.items():
-            if zone_name in zone_thresholds:
-                threshold = zone_thresholds[zone_name]
-                if count > threshold:
-                    alerts.append({
-                        'zone': zone_name,
-                        'current': count,
-                        'threshold': threshold,
-                        'message': f'⚠️ {zone_name} exceeded threshold! ({count}/{threshold})',
-                        'severity': 'high' if count > threshold * 1.5 else 'medium'
-                    })
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/analyze_image_binary', methods=['POST'])
+@token_required
+def analyze_image_binary():
+    """Analyze an image sent as raw JPEG/PNG bytes or a multipart 'image' field"""
+    try:
+        img = read_binary_image('image')
+        if img is None:
+            return jsonify({'success': False, 'message': 'No image provided'}), 400
         
-        return jsonify({
-            'success': True,
-            'people_count': people_count,
-            'detections': detections,
-            'zone_counts': zone_counts,
-            'alerts': alerts
-        }), 200
+        params = request.values
+        try:
+            zones = parse_compact_zones(params.get('zones'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        zones = resolve_zone_set(zones, params.get('zone_set_id'), request.current_user['user_id'])
+        options = {
+            'roi_inference': parse_optional_flag(params.get('roi_inference')),
+            'tiled': parse_optional_flag(params.get('tiled')),
+            'enable_heatmap': parse_optional_flag(params.get('enable_heatmap'))
+        }
         
+        return detection_response(analyze_image_array(img, zones, options))
+        
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -985,77 +2869,1011 @@ def analyze_frame():
     data = request.get_json()
     frame_data = data.get('frame')
     crossing_line = data.get('crossing_line')
-    zones = data.get('zones', {})
     
     if not frame_data:
         return jsonify({'success': False, 'message': 'No frame provided'}), 400
     
     try:
-        # Decode frame
-        if ',' in frame_data:
-            frame_data = frame_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(frame_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Run YOLO detection
-        results = model(img)
-        
-        detections = []
-        people_count = 0
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                if cls == 0:  # Person class
-                    people_count += 1
-                    bbox = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = bbox
-                    center_x = int((x1 + x2) / 2)
-                    center_y = int((y1 + y2) / 2)
-                    
-                    detections.append({
-                        'id': people_count,
-                        'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                        'center': [center_x, center_y]
-                    })
+        zones = resolve_zone_set(data.get('zones'), data.get('zone_set_id'), request.current_user['user_id'])
+        img = decode_image_data(frame_data)
+        source = f"video:{request.current_user['user_id']}"
+        return detection_response(analyze_frame_array(img, zones, crossing_line, data, source))
         
-        # Count zone occupancy
-        zone_counts = {}
-        if zones:
-            for zone_name, zone_points in zones.items():
-                count = 0
-                for det in detections:
-                    center_x, center_y = det['center']
-                    if point_in_polygon(center_x, center_y, zone_points):
-                        count += 1
-                zone_counts[zone_name] = count
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@app.route('/analyze_frame_binary', methods=['POST'])
+@token_required
+def analyze_frame_binary():
+    """Analyze a video frame sent as raw JPEG/PNG bytes or a multipart 'frame' field"""
+    try:
+        img = read_binary_image('frame')
+        if img is None:
+            return jsonify({'success': False, 'message': 'No frame provided'}), 400
+        
+        params = request.values
+        try:
+            zones = parse_compact_zones(params.get('zones'))
+            crossing_line = parse_compact_line(params.get('line'))
+            frame_number = params.get('frame_number')
+            frame_number = int(float(frame_number)) if frame_number not in (None, '') else None
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        zones = resolve_zone_set(zones, params.get('zone_set_id'), request.current_user['user_id'])
+        options = {
+            'roi_inference': parse_optional_flag(params.get('roi_inference')),
+            'frame_number': frame_number
+        }
+        source = f"video:{request.current_user['user_id']}"
+        
+        return detection_response(analyze_frame_array(img, zones, crossing_line, options, source))
+        
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+# ==================== CHUNKED VIDEO UPLOADS ====================
+
+chunked_uploads = {}
+
+def upload_part_path(upload_id):
+    return os.path.join(app.config['UPLOAD_FOLDER'], f'upload_{upload_id}.part')
+
+def file_sha256(path):
+    """SHA-256 of a file, read in bounded blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(app.config['UPLOAD_BUFFER_SIZE']), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def remove_upload(upload_id):
+    """Forget an upload and delete its partial or finished file"""
+    upload = chunked_uploads.pop(upload_id, None)
+    paths = [upload_part_path(upload_id)]
+    if upload and upload['path']:
+        paths.append(upload['path'])
+    
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def upload_in_use(path):
+    return any(job.video_path == path and not job.finished_at for job in list(video_jobs.values()))
+
+def expire_uploads():
+    """Remove stale partial uploads, old completed uploads and files left over from earlier runs"""
+    now = time.time()
+    
+    for upload_id, upload in list(chunked_uploads.items()):
+        limit = app.config['UPLOAD_RETENTION_SEC'] if upload['complete'] else app.config['UPLOAD_STALE_SEC']
+        if now - upload['updated_at'] < limit or upload_in_use(upload['path']):
+            continue
+        
+        # Skip uploads that are receiving a chunk right now
+        if upload['lock'].acquire(blocking=False):
+            try:
+                remove_upload(upload_id)
+            finally:
+                upload['lock'].release()
+    
+    folder = app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(folder):
+        return
+    
+    for filename in os.listdir(folder):
+        upload_id = os.path.splitext(filename)[0][len('upload_'):]
+        path = os.path.join(folder, filename)
+        if not filename.startswith('upload_') or upload_id in chunked_uploads or upload_in_use(path):
+            continue
+        try:
+            if now - os.path.getmtime(path) > app.config['UPLOAD_RETENTION_SEC']:
+                os.remove(path)
+        except OSError:
+            pass
+
+def get_user_upload(upload_id):
+    expire_uploads()
+    upload = chunked_uploads.get(upload_id)
+    if not upload or upload['user_id'] != request.current_user['user_id']:
+        return None
+    return upload
+
+@app.route('/uploads', methods=['POST'])
+@token_required
+def create_upload():
+    """Start a chunked upload, the client then PUTs the file in pieces"""
+    data = request.get_json()
+    filename = data.get('filename', '')
+    size = data.get('size')
+    
+    if not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({'success': False, 'message': 'Filename and size required'}), 400
+    
+    if size > app.config['UPLOAD_MAX_SIZE']:
+        return jsonify({
+            'success': False,
+            'message': f"File too large, the limit is {app.config['UPLOAD_MAX_SIZE'] // (1024 * 1024)} MB"
+        }), 413
+    
+    expire_uploads()
+    
+    upload_id = uuid.uuid4().hex
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    open(upload_part_path(upload_id), 'wb').close()
+    
+    chunked_uploads[upload_id] = {
+        'user_id': request.current_user['user_id'],
+        'filename': os.path.basename(filename),
+        'size': size,
+        'sha256': (data.get('sha256') or '').lower() or None,
+        'path': None,
+        'complete': False,
+        'updated_at': time.time(),
+        'lock': threading.Lock()
+    }
+    
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'chunk_size': app.config['UPLOAD_CHUNK_SIZE']
+    }), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@token_required
+def get_upload_status(upload_id):
+    """How many bytes the server has, so a client can resume after a disconnect"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    
+    received = upload['size'] if upload['complete'] else os.path.getsize(upload_part_path(upload_id))
+    
+    return jsonify({
+        'success': True,
+        'received': received,
+        'size': upload['size'],
+        'complete': upload['complete']
+    }), 200
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@token_required
+def upload_chunk(upload_id):
+    """Append one chunk, streamed from the request body straight to disk"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    
+    if upload['complete']:
+        return jsonify({'success': False, 'message': 'Upload already complete'}), 409
+    
+    if not upload['lock'].acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'Another chunk is being written'}), 409
+    
+    try:
+        part_path = upload_part_path(upload_id)
+        received = os.path.getsize(part_path)
+        offset = int(request.args.get('offset', received))
+        
+        if offset != received:
+            return jsonify({'success': False, 'message': 'Offset mismatch', 'received': received}), 409
+        
+        digest = hashlib.sha256()
+        written = 0
+        buffer_size = app.config['UPLOAD_BUFFER_SIZE']
+        
+        with open(part_path, 'ab') as f:
+            try:
+                for block in iter(lambda: request.stream.read(buffer_size), b''):
+                    if received + written + len(block) > upload['size']:
+                        raise ValueError('Chunk goes past the declared file size')
+                    f.write(block)
+                    digest.update(block)
+                    written += len(block)
+                    upload['updated_at'] = time.time()
+                
+                expected = request.headers.get('X-Chunk-SHA256')
+                if expected and expected.lower() != digest.hexdigest():
+                    raise ValueError('Chunk checksum mismatch')
+            except Exception:
+                # Drop the partial chunk so the client can resend it from the same offset
+                f.truncate(received)
+                raise
+        
+        return jsonify({'success': True, 'received': received + written}), 200
+        
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e), 'received': received}), 422
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        upload['lock'].release()
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@token_required
+def complete_upload(upload_id):
+    """Verify size and checksum, then report the video's properties"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    
+    with upload['lock']:
+        if not upload['complete']:
+            part_path = upload_part_path(upload_id)
+            received = os.path.getsize(part_path)
+            
+            if received != upload['size']:
+                return jsonify({'success': False, 'message': 'Upload incomplete', 'received': received}), 409
+            
+            checksum = file_sha256(part_path)
+            if upload['sha256'] and checksum != upload['sha256']:
+                return jsonify({'success': False, 'message': 'Checksum mismatch', 'sha256': checksum}), 422
+            
+            extension = os.path.splitext(upload['filename'])[1].lower() or '.mp4'
+            upload['path'] = os.path.join(app.config['UPLOAD_FOLDER'], f'upload_{upload_id}{extension}')
+            os.replace(part_path, upload['path'])
+            upload['sha256'] = checksum
+            upload['complete'] = True
+            upload['updated_at'] = time.time()
+    
+    # Probe with a private capture, video jobs open their own when they run
+    cap = cv2.VideoCapture(upload['path'])
+    try:
+        if not cap.isOpened():
+            return jsonify({'success': False, 'message': 'Uploaded file is not a readable video'}), 422
         
         return jsonify({
             'success': True,
-            'people_count': people_count,
-            'detections': detections,
-            'zone_counts': zone_counts,
-            'crossed_count': 0  # Implement crossing logic if needed
+            'message': 'Upload complete',
+            'upload_id': upload_id,
+            'sha256': upload['sha256'],
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         }), 200
+    finally:
+        cap.release()
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@token_required
+def delete_upload(upload_id):
+    """Abort an upload or remove a finished one"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'success': False, 'message': 'Upload not found'}), 404
+    
+    if upload_in_use(upload['path']):
+        return jsonify({'success': False, 'message': 'A video job is still reading this upload'}), 409
+    
+    if not upload['lock'].acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'A chunk is being written'}), 409
+    
+    try:
+        remove_upload(upload_id)
+    finally:
+        upload['lock'].release()
+    
+    return jsonify({'success': True, 'message': 'Upload deleted'}), 200
+
+# ==================== VIDEO ANALYSIS JOBS ====================
+
+class VideoAnalysisJob:
+    """Decode an uploaded video sequentially in the background and record per-frame results"""
+    
+    def __init__(self, job_id, user_id, video_path, sample_fps, zones, crossing_line):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.video_path = video_path
+        self.sample_fps = sample_fps
+        self.zones = zones or {}
+        self.zone_set = compile_zones(self.zones, user_id)
+        self.crossing_line = crossing_line
+        self.status = 'queued'
+        self.error = None
+        self.cancelled = False
+        self.total_frames = 0
+        self.video_fps = 0.0
+        self.frame_position = 0
+        self.frames = []
+        self.started_at = None
+        self.finished_at = None
+        self.thread = None
+        self.owns_video = True
+        
+        # Sampled frames are far apart, so lost people stay matchable for a few seconds of video
+        self.tracker = new_person_tracker(
+            max_age=max(1, int(round(sample_fps * 3))),
+            max_distance=app.config['VIDEO_JOB_MAX_MATCH_DISTANCE']
+        )
+    
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        self.status = 'running'
+        self.started_at = time.time()
+        cap = cv2.VideoCapture(self.video_path)
+        
+        try:
+            if not cap.isOpened():
+                raise RuntimeError('Could not open video')
+            
+            self.video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            stride = max(1, int(round(self.video_fps / self.sample_fps)))
+            
+            frame_number = 0
+            while not self.cancelled:
+                # Frames between samples are grabbed but never converted, and we never seek
+                if frame_number % stride:
+                    if not cap.grab():
+                        break
+                    frame_number += 1
+                    continue
+                
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                roi = inference_roi(frame.shape, self.zones, self.crossing_line)
+                boxes, _ = track_people(self.tracker, detect_people(frame, roi), self.crossing_line)
+                zone_counts = count_zone_occupancy(boxes, self.zone_set, frame.shape)
+                
+                self.frames.append({
+                    'frame_number': frame_number,
+                    'time_sec': round(frame_number / self.video_fps, 3),
+                    'people_count': len(boxes),
+                    'zone_counts': zone_counts,
+                    'crossed_count': len(self.tracker.crossed_ids)
+                })
+                
+                frame_number += 1
+                self.frame_position = frame_number
+            
+            self.status = 'cancelled' if self.cancelled else 'completed'
+        except Exception as e:
+            self.status = 'failed'
+            self.error = str(e)
+        finally:
+            cap.release()
+            self.finished_at = time.time()
+    
+    def progress(self):
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        percent = min(100.0, 100.0 * self.frame_position / self.total_frames) if self.total_frames else 0.0
+        if self.status == 'completed':
+            percent = 100.0
+        
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'error': self.error,
+            'frames_analyzed': len(self.frames),
+            'frame_position': self.frame_position,
+            'total_frames': self.total_frames,
+            'percent': round(percent, 1),
+            'elapsed_sec': round(elapsed, 2),
+            'analyzed_fps': round(len(self.frames) / elapsed, 2) if elapsed else 0.0
+        }
+    
+    def summary(self):
+        counts = [frame['people_count'] for frame in self.frames]
+        return {
+            'max_people': max(counts) if counts else 0,
+            'avg_people': round(sum(counts) / len(counts), 2) if counts else 0.0,
+            'total_crossings': len(self.tracker.crossed_ids),
+            'duration_sec': round(self.total_frames / self.video_fps, 2) if self.video_fps else 0.0
+        }
+
+video_jobs = {}
+
+def remove_video_job(job):
+    """Cancel a job, forget its results and remove the video it owns"""
+    job.cancelled = True
+    if job.thread:
+        job.thread.join(timeout=5)
+    
+    # Videos from chunked uploads belong to the upload, not the job
+    if job.owns_video and os.path.exists(job.video_path):
+        try:
+            os.remove(job.video_path)
+        except OSError:
+            pass
+    
+    video_jobs.pop(job.job_id, None)
+
+def expire_video_jobs():
+    """Drop jobs that finished more than VIDEO_JOB_RETENTION_SEC ago"""
+    cutoff = time.time() - app.config['VIDEO_JOB_RETENTION_SEC']
+    for job in list(video_jobs.values()):
+        if job.finished_at and job.finished_at < cutoff:
+            remove_video_job(job)
+
+def get_user_job(job_id):
+    """Job owned by the current user (admins can see every job), or None"""
+    expire_video_jobs()
+    job = video_jobs.get(job_id)
+    if not job:
+        return None
+    if job.user_id != request.current_user['user_id'] and request.current_user.get('role') != 'admin':
+        return None
+    return job
+
+@app.route('/video_jobs', methods=['POST'])
+@token_required
+def create_video_job():
+    """Submit a video (multipart file or finished chunked upload) and analyse it in the background"""
+    video = request.files.get('video')
+    params = request.values
+    upload = get_user_upload(params.get('upload_id', ''))
+    
+    if upload and not upload['complete']:
+        return jsonify({'success': False, 'message': 'Upload not complete'}), 409
+    
+    if not upload and (not video or not video.filename):
+        return jsonify({'success': False, 'message': 'No video provided'}), 400
+    
+    try:
+        sample_fps = float(params.get('sample_fps') or app.config['VIDEO_JOB_SAMPLE_FPS'])
+        zones = parse_compact_zones(params.get('zones'))
+        crossing_line = parse_compact_line(params.get('line'))
+        compile_zones(zones, request.current_user['user_id'])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if sample_fps <= 0:
+        return jsonify({'success': False, 'message': 'sample_fps must be positive'}), 400
+    
+    expire_video_jobs()
+    
+    try:
+        job_id = uuid.uuid4().hex
+        
+        if upload:
+            video_path = upload['path']
+        else:
+            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+            extension = os.path.splitext(video.filename)[1].lower() or '.mp4'
+            video_path = os.path.join(app.config['UPLOAD_FOLDER'], f'job_{job_id}{extension}')
+            video.save(video_path)
+        
+        job = VideoAnalysisJob(job_id, request.current_user['user_id'], video_path, sample_fps, zones, crossing_line)
+        job.owns_video = not upload
+        video_jobs[job_id] = job
+        job.start()
+        
+        return jsonify({'success': True, 'job_id': job_id, 'message': 'Video analysis started'}), 202
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@app.route('/video_jobs/<job_id>', methods=['GET'])
+@token_required
+def get_video_job(job_id):
+    """Progress of a video analysis job"""
+    job = get_user_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job.progress()}), 200
+
+@app.route('/video_jobs/<job_id>/results', methods=['GET'])
+@token_required
+def get_video_job_results(job_id):
+    """Per-frame counts and crossings recorded so far"""
+    job = get_user_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    try:
+        start = int(request.args.get('start', 0))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'start must be an integer'}), 400
+    
+    if start < 0:
+        return jsonify({'success': False, 'message': 'start must not be negative'}), 400
+    
+    return jsonify({
+        'success': True,
+        **job.progress(),
+        'summary': job.summary(),
+        'frames': job.frames[start:]
+    }), 200
+
+@app.route('/video_jobs/<job_id>', methods=['DELETE'])
+@token_required
+def delete_video_job(job_id):
+    """Cancel a job and remove its video"""
+    job = get_user_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    remove_video_job(job)
+    
+    return jsonify({'success': True, 'message': 'Job deleted'}), 200
+
+# ==================== WEBSOCKET STREAMING ====================
+
+if sock:
+    @sock.route('/ws/analyze')
+    def analyze_stream(ws):
+        """Persistent analysis session: authenticate once, set zones once, then stream binary frames"""
+        try:
+            run_analysis_session(ws)
+        except ConnectionClosed:
+            pass
+
+    def run_analysis_session(ws):
+        try:
+            hello = json.loads(ws.receive(timeout=10) or '{}')
+        except ValueError:
+            hello = {}
+        
+        payload = verify_token(hello.get('token', '')) if hello.get('type') == 'auth' else None
+        if not payload:
+            ws.send(json.dumps({'type': 'auth', 'success': False, 'message': 'Token is invalid or expired'}))
+            ws.close()
+            return
+        
+        ws.send(json.dumps({'type': 'auth', 'success': True}))
+        
+        source = f"video:{payload['user_id']}"
+        person_trackers.pop(source, None)  # a new session is a new video, ids and crossings start over
+        session = {'zones': {}, 'crossing_line': None, 'options': {}}
+        seq = 0
+        skipped = 0
+        
+        def handle_text(message):
+            try:
+                config = json.loads(message)
+            except ValueError:
+                ws.send(json.dumps({'type': 'error', 'message': 'Invalid JSON message'}))
+                return
+            
+            if config.get('type') == 'config':
+                try:
+                    zone_set = resolve_zone_set(config.get('zones'), config.get('zone_set_id'), payload['user_id'])
+                except UnknownZoneSet as e:
+                    ws.send(json.dumps({'type': 'error', 'error': 'unknown_zone_set', 'message': f'Unknown zone_set_id {e}'}))
+                    return
+                except InvalidZones as e:
+                    ws.send(json.dumps({'type': 'error', 'message': str(e)}))
+                    return
+                
+                session['zones'] = zone_set
+                session['crossing_line'] = config.get('crossing_line')
+                session['options'] = {'roi_inference': config.get('roi_inference')}
+                ws.send(json.dumps({
+                    'type': 'config',
+                    'success': True,
+                    'zone_set_id': zone_set.zone_set_id if zone_set else None
+                }))
+        
+        while True:
+            message = ws.receive()
+            if message is None:
+                break
+            
+            if isinstance(message, str):
+                handle_text(message)
+                continue
+            
+            # Backpressure: if more frames arrived while we were busy, only the newest is analysed
+            while True:
+                newer = ws.receive(timeout=0)
+                if newer is None:
+                    break
+                if isinstance(newer, str):
+                    handle_text(newer)
+                else:
+                    message = newer
+                    skipped += 1
+            
+            seq += 1
+            img = cv2.imdecode(np.frombuffer(message, np.uint8), cv2.IMREAD_COLOR)
+            if img is None:
+                ws.send(json.dumps({'type': 'error', 'seq': seq, 'message': 'Could not decode frame'}))
+                continue
+            
+            try:
+                result = detection_fields(
+                    analyze_frame_array(img, session['zones'], session['crossing_line'], session['options'], source)
+                )
+                result.update({'type': 'result', 'seq': seq, 'server_skipped': skipped})
+                ws.send(app.json.dumps(result))
+            except Exception as e:
+                ws.send(json.dumps({'type': 'error', 'seq': seq, 'message': str(e)}))
+
+# ==================== WEBCAM PIPELINE ====================
+
+class LatestFrameGrabber:
+    """Keep reading a capture source in the background and hold only the newest frame"""
+    
+    def __init__(self, capture):
+        self.capture = capture
+        self.frame = None
+        self.timestamp = None
+        self.seq = 0
+        self.consumed_seq = 0
+        self.dropped = 0
+        self.running = False
+        self.thread = None
+        self.frame_ready = threading.Condition()
+    
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.running = False
+        with self.frame_ready:
+            self.frame_ready.notify_all()
+        if self.thread:
+            self.thread.join(timeout=2)
+            self.thread = None
+    
+    def _run(self):
+        # Reading continuously keeps OpenCV's internal buffer drained
+        while self.running:
+            ret, frame = self.capture.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            
+            with self.frame_ready:
+                if self.seq > self.consumed_seq:
+                    self.dropped += 1
+                self.frame = frame
+                self.timestamp = time.time()
+                self.seq += 1
+                self.frame_ready.notify_all()
+    
+    def latest(self, wait_new=False, timeout=1.0):
+        """Return (frame, timestamp, seq) of the newest frame, optionally waiting for an unseen one"""
+        with self.frame_ready:
+            if wait_new:
+                self.frame_ready.wait_for(lambda: self.seq > self.consumed_seq or not self.running, timeout)
+                if self.seq == self.consumed_seq:
+                    return None, None, self.seq
+            elif self.frame is None:
+                self.frame_ready.wait_for(lambda: self.frame is not None or not self.running, timeout)
+            
+            if self.frame is None:
+                return None, None, 0
+            
+            self.consumed_seq = self.seq
+            return self.frame.copy(), self.timestamp, self.seq
+
+frame_grabbers = {}
+
+class WebcamPipeline:
+    """Capture, infer, annotate and encode webcam frames in separate threads with bounded queues"""
+    
+    STAGES = ('capture', 'infer', 'annotate', 'encode')
+    
+    def __init__(self, grabber, source='webcam', queue_size=2, inference_fps=10, idle_sec=5):
+        self.grabber = grabber
+        self.source = source
+        self.inference_interval = 1.0 / inference_fps if inference_fps > 0 else 0.0
+        self.idle_sec = idle_sec
+        self.options = {'zones': {}, 'zone_set': None, 'crossing_line': None, 'roi_inference': None, 'enable_heatmap': False}
+        self.queues = {stage: queue.Queue(maxsize=queue_size) for stage in self.STAGES[1:]}
+        self.latest = None
+        self.latest_jpeg = None
+        self.frame_shape = None
+        self.viewers = 0
+        self.subscribers = 0
+        self.annotated_wanted_until = 0.0
+        self.polled_until = 0.0
+        self.skipped = {'rate_limited': 0, 'idle': 0}
+        self.latest_ready = threading.Condition()
+        self.running = False
+        self.threads = []
+        self.next_frame_id = 1
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            stage: {'frames': 0, 'dropped': 0, 'total_ms': 0.0, 'last_ms': 0.0}
+            for stage in self.STAGES
+        }
+    
+    def start(self):
+        self.running = True
+        targets = {
+            'capture': self._capture_loop,
+            'infer': lambda: self._stage_loop('infer', self._infer, 'annotate'),
+            'annotate': lambda: self._stage_loop('annotate', self._annotate, 'encode'),
+            'encode': lambda: self._stage_loop('encode', self._encode, None)
+        }
+        self.threads = [threading.Thread(target=target, daemon=True) for target in targets.values()]
+        for thread in self.threads:
+            thread.start()
+    
+    def stop(self):
+        self.running = False
+        with self.latest_ready:
+            self.latest_ready.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=2)
+        self.threads = []
+    
+    def update_options(self, zones, crossing_line, roi_inference=None, enable_heatmap=False):
+        """Zones and line from the latest request apply to frames captured from now on"""
+        zone_set = compile_zones(zones)
+        self.options = {
+            'zones': zone_set.zones if zone_set else {},
+            'zone_set': zone_set,
+            'crossing_line': crossing_line,
+            'roi_inference': roi_inference,
+            'enable_heatmap': bool(enable_heatmap)
+        }
+    
+    def want_annotated(self, seconds=2.0):
+        """A poller asked for annotated frames, keep drawing and encoding them for a while"""
+        self.annotated_wanted_until = time.time() + seconds
+    
+    def needs_annotation(self):
+        return self.viewers > 0 or time.time() < self.annotated_wanted_until
+    
+    def touch(self):
+        """A poller read results, keep detecting for idle_sec; returns True if detection was paused"""
+        paused = not self.is_active()
+        self.polled_until = time.time() + self.idle_sec
+        return paused
+    
+    def is_active(self):
+        """Someone polled recently, watches the stream or listens to events"""
+        return self.needs_annotation() or self.subscribers > 0 or time.time() < self.polled_until
+    
+    def wait_for_result(self, timeout=1.0, fresh=False):
+        """Newest finished (result, jpeg), waiting briefly for the first one (or a newer one when fresh)"""
+        with self.latest_ready:
+            if self.latest is None:
+                self.latest_ready.wait(timeout)
+            elif fresh:
+                last_frame_id = self.latest['frame_id']
+                self.latest_ready.wait_for(lambda: self.latest['frame_id'] > last_frame_id or not self.running, timeout)
+            return self.latest, self.latest_jpeg
+    
+    def wait_for_frame(self, last_frame_id, timeout=1.0):
+        """Block until a frame newer than last_frame_id is encoded, returns (result, jpeg) or None"""
+        with self.latest_ready:
+            self.latest_ready.wait_for(
+                lambda: (self.latest and self.latest['frame_id'] > last_frame_id) or not self.running,
+                timeout
+            )
+            if not self.latest or self.latest['frame_id'] <= last_frame_id:
+                return None
+            return self.latest, self.latest_jpeg
+    
+    def _record(self, stage, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.stats_lock:
+            self.stats[stage]['frames'] += 1
+            self.stats[stage]['total_ms'] += elapsed_ms
+            self.stats[stage]['last_ms'] = elapsed_ms
+    
+    def _put(self, stage, item):
+        """Hand an item to the next stage, dropping its oldest queued item if it is behind"""
+        target = self.queues[stage]
+        while True:
+            try:
+                target.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    target.get_nowait()
+                    with self.stats_lock:
+                        self.stats[stage]['dropped'] += 1
+                except queue.Empty:
+                    pass
+    
+    def _capture_loop(self):
+        next_infer_at = 0.0
+        
+        while self.running:
+            started = time.perf_counter()
+            frame, timestamp, _ = self.grabber.latest(wait_new=True, timeout=0.5)
+            if frame is None:
+                continue
+            self._record('capture', started)
+            
+            # Detection runs at most inference_fps and not at all while nobody reads the results
+            if not self.is_active():
+                self.skipped['idle'] += 1
+                continue
+            if started < next_infer_at:
+                self.skipped['rate_limited'] += 1
+                continue
+            next_infer_at = started + self.inference_interval
+            
+            self._put('infer', {
+                'frame_id': self.next_frame_id,
+                'frame_timestamp': timestamp,
+                'frame': frame,
+                'options': self.options
+            })
+            self.next_frame_id += 1
+    
+    def _stage_loop(self, stage, work, next_stage):
+        while self.running:
+            try:
+                item = self.queues[stage].get(timeout=0.1)
+            except queue.Empty:
+                continue
+            
+            started = time.perf_counter()
+            try:
+                item = work(item)
+            except Exception as e:
+                print(f"❌ Webcam pipeline {stage} error: {e}")
+                continue
+            self._record(stage, started)
+            
+            if next_stage:
+                self._put(next_stage, item)
+    
+    def _infer(self, item):
+        options = item['options']
+        frame = item['frame']
+        zones = options['zones']
+        
+        roi = inference_roi(frame.shape, zones, options['crossing_line'], options['roi_inference'])
+        boxes, inference_skipped, motion = detect_people_gated(frame, self.source, roi)
+        tracker = get_person_tracker(self.source)
+        boxes, track_ids = track_people(tracker, boxes, options['crossing_line'])
+        zone_counts = count_zone_occupancy(boxes, options['zone_set'], frame.shape)
+        
+        record_heatmap(self.source, frame.shape, boxes, live=options['enable_heatmap'])
+        
+        item.update({
+            'boxes': boxes,
+            'track_ids': track_ids,
+            'zone_counts': zone_counts,
+            'alerts': check_zone_alerts(zone_counts, zone_thresholds),
+            'crossed_count': len(tracker.crossed_ids),
+            'inference_skipped': inference_skipped,
+            'motion': round(motion, 4),
+            'inference_roi': roi
+        })
+        return item
+    
+    def _annotate(self, item):
+        # Geometry-only clients draw overlays themselves, so only keep a low-rate raw preview
+        update_preview(self.source, item['frame'])
+        
+        item['annotated'] = self.needs_annotation()
+        if item['annotated']:
+            annotate_frame(item['frame'], item['boxes'], item['track_ids'],
+                           item['options']['zones'], item['options']['crossing_line'])
+        return item
+    
+    def _encode(self, item):
+        # Encoded once per frame and shared by every poller and stream viewer
+        buffer = None
+        if item['annotated']:
+            _, buffer = cv2.imencode('.jpg', item['frame'])
+        
+        result = {
+            'success': True,
+            'count': len(item['boxes']),
+            'boxes': item['boxes'],
+            'track_ids': item['track_ids'],
+            'zone_counts': item['zone_counts'],
+            'zone_set_id': item['options']['zone_set'].zone_set_id if item['options']['zone_set'] else None,
+            'crossed_count': item['crossed_count'],
+            'alerts': item['alerts'],
+            'inference_skipped': item['inference_skipped'],
+            'motion': item['motion'],
+            'inference_roi': item['inference_roi'],
+            'frame_id': item['frame_id'],
+            'frame_timestamp': item['frame_timestamp'],
+            'dropped_frames': self.grabber.dropped
+        }
+        
+        with self.latest_ready:
+            self.latest = result
+            self.latest_jpeg = buffer.tobytes() if buffer is not None else None
+            self.frame_shape = item['frame'].shape
+            self.latest_ready.notify_all()
+        return item
+    
+    def get_stats(self):
+        with self.stats_lock:
+            stages = {}
+            for stage, stats in self.stats.items():
+                stages[stage] = {
+                    'frames': stats['frames'],
+                    'dropped': stats['dropped'],
+                    'last_ms': round(stats['last_ms'], 2),
+                    'avg_ms': round(stats['total_ms'] / stats['frames'], 2) if stats['frames'] else 0.0,
+                    'queue_depth': self.queues[stage].qsize() if stage in self.queues else 0
+                }
+        
+        latest = self.latest
+        return {
+            'stages': stages,
+            'latest_frame_id': latest['frame_id'] if latest else None,
+            'latest_age_ms': round((time.time() - latest['frame_timestamp']) * 1000, 1) if latest else None,
+            'dropped_frames': self.grabber.dropped,
+            'paused': not self.is_active(),
+            'skipped_frames': dict(self.skipped)
+        }
+
+webcam_pipeline = None
+webcam_lock = threading.Lock()
+
+def release_webcam():
+    """Stop the webcam pipeline and grabber, release the capture and drop per-camera state"""
+    global video_capture, webcam_pipeline
+    
+    # The pipeline and grabber read from the capture, so they must stop before the release
+    if webcam_pipeline:
+        webcam_pipeline.stop()
+        webcam_pipeline = None
+    
+    grabber = frame_grabbers.pop('webcam', None)
+    if grabber:
+        grabber.stop()
+    
+    if video_capture:
+        video_capture.release()
+        video_capture = None
+    
+    motion_gates.pop('webcam', None)
+    keyframe_propagators.pop('webcam', None)
+    frame_previews.pop('webcam', None)
+    heatmaps.pop('webcam', None)
+    person_trackers.pop('webcam', None)
+    if 'webcam' in heatmap_histories:
+        heatmap_histories['webcam'].flush()
+
 
 @app.route('/start_webcam', methods=['POST'])
 @token_required
 def start_webcam():
     """Start webcam capture"""
-    global video_capture
+    global video_capture, webcam_pipeline
     
     try:
-        video_capture = cv2.VideoCapture(0)
-        
-        if not video_capture.isOpened():
-            return jsonify({'success': False, 'message': 'Could not open webcam'}), 500
+        with webcam_lock:
+            # A second start replaces the running camera instead of leaking its threads and device
+            release_webcam()
+            
+            video_capture = cv2.VideoCapture(0)
+            
+            if not video_capture.isOpened():
+                video_capture.release()
+                video_capture = None
+                return jsonify({'success': False, 'message': 'Could not open webcam'}), 500
+            
+            grabber = LatestFrameGrabber(video_capture)
+            grabber.start()
+            frame_grabbers['webcam'] = grabber
+            
+            if app.config['WEBCAM_PIPELINE_ENABLED']:
+                webcam_pipeline = WebcamPipeline(
+                    grabber,
+                    queue_size=app.config['PIPELINE_QUEUE_SIZE'],
+                    inference_fps=app.config['PIPELINE_INFERENCE_FPS'],
+                    idle_sec=app.config['PIPELINE_IDLE_SEC']
+                )
+                webcam_pipeline.start()
         
         return jsonify({'success': True, 'message': 'Webcam started'}), 200
         
@@ -1067,12 +3885,9 @@ def start_webcam():
 @token_required
 def stop_webcam():
     """Stop webcam capture"""
-    global video_capture
-    
     try:
-        if video_capture:
-            video_capture.release()
-            video_capture = None
+        with webcam_lock:
+            release_webcam()
         
         return jsonify({'success': True, 'message': 'Webcam stopped'}), 200
         
@@ -1091,94 +3906,104 @@ def get_webcam_frame():
     
     data = request.get_json()
     crossing_line = data.get('crossing_line')
-    zones = data.get('zones', {})
+    geometry_only = data.get('response_mode') == 'geometry'
+    enable_heatmap = data.get('enable_heatmap', False)
     
     try:
-        ret, frame = video_capture.read()
+        zone_set = resolve_zone_set(data.get('zones'), data.get('zone_set_id'), request.current_user['user_id'])
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    zones = zone_set.zones if zone_set else {}
+    
+    # With the pipeline running, just return the newest finished frame
+    if webcam_pipeline:
+        webcam_pipeline.update_options(zone_set, crossing_line, data.get('roi_inference'), enable_heatmap)
+        paused = webcam_pipeline.touch()
+        if not geometry_only:
+            webcam_pipeline.want_annotated()
+        
+        # After a pause the newest result is stale, wait for the first frame detected since
+        result, jpeg = webcam_pipeline.wait_for_result(fresh=paused)
         
-        if not ret:
+        if result is None:
+            return jsonify({'success': False, 'message': 'Webcam pipeline is starting'}), 503
+        
+        result = dict(result, frame_age_ms=round((time.time() - result['frame_timestamp']) * 1000, 1))
+        
+        if geometry_only:
+            result = geometry_response(result, webcam_pipeline.frame_shape, frame_previews.get('webcam'),
+                                       data.get('preview_id'))
+        elif jpeg is not None:
+            result['frame'] = base64.b64encode(jpeg).decode('utf-8')
+        
+        if enable_heatmap:
+            result['heatmap'] = encode_heatmap('webcam', webcam_pipeline.frame_shape)
+        
+        return detection_response(result)
+    
+    grabber = frame_grabbers.get('webcam')
+    
+    try:
+        frame, frame_timestamp, _ = grabber.latest()
+        
+        if frame is None:
             return jsonify({'success': False, 'message': 'Could not read frame'}), 500
         
-        # Run YOLO detection
-        results = model(frame)
-        
-        detections = []
-        people_count = 0
-        
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                cls = int(box.cls[0])
-                if cls == 0:  # Person class
-                    people_count += 1
-                    bbox = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = bbox
-                    center_x = int((x1 + x2) / 2)
-                    center_y = int((y1 + y2) / 2)
-                    
-                    # Draw on frame
-                    cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-                    cv2.putText(frame, f'Person {people_count}', (int(x1), int(y1)-10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                    
-                    detections.append({
-                        'id': people_count,
-                        'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                        'center': [center_x, center_y]
-                    })
-        
-        # Draw zones
-        if zones:
-            for zone_name, zone_points in zones.items():
-                points = np.array([[p['x'], p['y']] for p in zone_points], np.int32)
-                cv2.polylines(frame, [points], True, (0, 255, 0), 2)
-                cv2.putText(frame, zone_name, (points[0][0], points[0][1]-10),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        # Draw crossing line
-        if crossing_line:
-            start = crossing_line['start']
-            end = crossing_line['end']
-            cv2.line(frame, (start['x'], start['y']), (end['x'], end['y']), (0, 0, 255), 3)
+        # Run YOLO detection (skipped when the camera shows a static scene)
+        roi = inference_roi(frame.shape, zones, crossing_line, data.get('roi_inference'))
+        boxes, inference_skipped, motion = detect_people_gated(frame, 'webcam', roi)
+        tracker = get_person_tracker('webcam')
+        boxes, track_ids = track_people(tracker, boxes, crossing_line)
+        people_count = len(boxes)
+        
+        # Draw detections, zones and crossing line (geometry-only clients draw these themselves)
+        preview = None
+        if geometry_only:
+            preview = update_preview('webcam', frame)
+        else:
+            annotate_frame(frame, boxes, track_ids, zones, crossing_line)
         
         # Count zone occupancy
-        zone_counts = {}
-        if zones:
-            for zone_name, zone_points in zones.items():
-                count = 0
-                for det in detections:
-                    center_x, center_y = det['center']
-                    if point_in_polygon(center_x, center_y, zone_points):
-                        count += 1
-                zone_counts[zone_name] = count
+        zone_counts = count_zone_occupancy(boxes, zone_set, frame.shape)
+        
+        record_heatmap('webcam', frame.shape, boxes, live=enable_heatmap)
         
         # Encode frame
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_base64 = base64.b64encode(buffer).decode('utf-8')
+        frame_base64 = None
+        if not geometry_only:
+            _, buffer = cv2.imencode('.jpg', frame)
+            frame_base64 = base64.b64encode(buffer).decode('utf-8')
         
         # Check for alerts
-        alerts = []
-        for zone_name, count in zone_counts.items():
-            if zone_name in zone_thresholds:
-                threshold = zone_thresholds[zone_name]
-                if count > threshold:
-                    alerts.append({
-                        'zone': zone_name,
-                        'current': count,
-                        'threshold': threshold,
-                        'message': f'⚠️ {zone_name} exceeded threshold! ({count}/{threshold})',
-                        'severity': 'high' if count > threshold * 1.5 else 'medium'
-                    })
+        alerts = check_zone_alerts(zone_counts, zone_thresholds)
         
-        return jsonify({
+        result = {
             'success': True,
             'frame': frame_base64,
             'count': people_count,
-            'detections': detections,
+            'boxes': boxes,
+            'track_ids': track_ids,
             'zone_counts': zone_counts,
-            'crossed_count': 0,
-            'alerts': alerts
-        }), 200
+            'zone_set_id': zone_set.zone_set_id if zone_set else None,
+            'crossed_count': len(tracker.crossed_ids),
+            'alerts': alerts,
+            'inference_skipped': inference_skipped,
+            'motion': round(motion, 4),
+            'inference_roi': roi,
+            'frame_timestamp': frame_timestamp,
+            'frame_age_ms': round((time.time() - frame_timestamp) * 1000, 1),
+            'dropped_frames': grabber.dropped
+        }
+        
+        if enable_heatmap:
+            result['heatmap'] = encode_heatmap('webcam', frame.shape)
+        
+        if geometry_only:
+            result = geometry_response(result, frame.shape, preview, data.get('preview_id'))
+        
+        return detection_response(result)
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -1188,14 +4013,191 @@ def get_webcam_frame():
 @token_required
 def reset_webcam_crossings():
     """Reset webcam crossing counter"""
-    global crossed_persons, heatmap_accumulator
+    global crossed_persons
     
     crossed_persons = set()
-    heatmap_accumulator = None
+    if 'webcam' in person_trackers:
+        person_trackers['webcam'].crossed_ids.clear()
+    heatmaps.pop('webcam', None)
     
     return jsonify({'success': True, 'message': 'Crossings and heatmap reset'}), 200
 
 
+@app.route('/webcam_stream', methods=['GET'])
+@stream_token_required
+def webcam_stream():
+    """MJPEG stream of annotated webcam frames, all viewers share the pipeline's single encode"""
+    pipeline = webcam_pipeline
+    if not pipeline:
+        return jsonify({'success': False, 'message': 'Webcam pipeline not running'}), 400
+    
+    def generate():
+        last_frame_id = 0
+        pipeline.viewers += 1
+        try:
+            while pipeline.running:
+                latest = pipeline.wait_for_frame(last_frame_id)
+                if latest is None or latest[1] is None:
+                    continue
+                
+                result, jpeg = latest
+                last_frame_id = result['frame_id']
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ' +
+                       str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+        finally:
+            pipeline.viewers -= 1
+    
+    return Response(stream_with_context(generate()), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+@app.route('/webcam_events', methods=['GET'])
+@stream_token_required
+def webcam_events():
+    """Server-Sent Events with counts and alerts for every processed webcam frame"""
+    pipeline = webcam_pipeline
+    if not pipeline:
+        return jsonify({'success': False, 'message': 'Webcam pipeline not running'}), 400
+    
+    def generate():
+        last_frame_id = 0
+        pipeline.subscribers += 1
+        try:
+            while pipeline.running:
+                latest = pipeline.wait_for_frame(last_frame_id, timeout=5.0)
+                if latest is None:
+                    yield ': keepalive\n\n'
+                    continue
+                
+                result, _ = latest
+                last_frame_id = result['frame_id']
+                yield f'data: {app.json.dumps(detection_fields(result))}\n\n'
+        finally:
+            pipeline.subscribers -= 1
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/webcam_stream_config', methods=['POST'])
+@token_required
+def webcam_stream_config():
+    """Set the zones and crossing line used by the server-side webcam loop"""
+    if not webcam_pipeline:
+        return jsonify({'success': False, 'message': 'Webcam pipeline not running'}), 400
+    
+    data = request.get_json()
+    try:
+        zone_set = resolve_zone_set(data.get('zones'), data.get('zone_set_id'), request.current_user['user_id'])
+    except UnknownZoneSet as e:
+        return unknown_zone_set_response(e)
+    except InvalidZones as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    webcam_pipeline.update_options(zone_set, data.get('crossing_line'), data.get('roi_inference'),
+                                   data.get('enable_heatmap', False))
+    
+    return jsonify({
+        'success': True,
+        'message': 'Stream configuration updated',
+        'zone_set_id': zone_set.zone_set_id if zone_set else None
+    }), 200
+
+
+@app.route('/webcam_pipeline_stats', methods=['GET'])
+@token_required
+def webcam_pipeline_stats():
+    """Per-stage latency and queue depth of the webcam pipeline"""
+    if not webcam_pipeline:
+        return jsonify({'success': False, 'message': 'Webcam pipeline not running'}), 400
+    
+    return jsonify({'success': True, **webcam_pipeline.get_stats()}), 200
+
+
+@app.route('/inference_stats', methods=['GET'])
+@token_required
+def inference_stats():
+    """Report batching, cache, zone set, motion gate, keyframe and tracker statistics"""
+    gates = {}
+    for source, gate in motion_gates.items():
+        total = gate.stats['inferences_run'] + gate.stats['inferences_skipped']
+        gates[source] = {
+            **gate.stats,
+            'skip_ratio': round(gate.stats['inferences_skipped'] / total, 3) if total else 0.0
+        }
+    
+    return jsonify({
+        'success': True,
+        'batcher': inference_batcher.stats,
+        'detection_cache': {**detection_cache.stats, 'entries': len(detection_cache.entries)},
+        'zone_sets': {**zone_set_cache.stats, 'entries': len(zone_set_cache.entries), 'bytes': zone_set_cache.nbytes()},
+        'motion_gates': gates,
+        'keyframes': {source: propagator.stats for source, propagator in keyframe_propagators.items()},
+        'trackers': {source: tracker.stats for source, tracker in person_trackers.items()}
+    }), 200
+
+
+# ==================== HEATMAP HISTORY ====================
+
+def parse_history_time(value):
+    """ISO date/time from a query string, as naive local time like the stored tiles"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+@app.route('/heatmap_history', methods=['GET'])
+@token_required
+def heatmap_history():
+    """Summed heatmap of a camera over any time range, e.g. yesterday 17:00 to 19:00"""
+    source = request.args.get('source', 'webcam')
+    if not re.fullmatch(r'[\w:-]+', source):
+        return jsonify({'success': False, 'message': 'Invalid source'}), 400
+    
+    try:
+        start = parse_history_time(request.args['start'])
+        end = parse_history_time(request.args['end'])
+        width = int(request.args.get('width', 640))
+    except (KeyError, ValueError, OverflowError):
+        return jsonify({'success': False, 'message': 'start and end must be ISO times, e.g. 2025-10-20T17:00'}), 400
+    
+    if end <= start:
+        return jsonify({'success': False, 'message': 'end must be after start'}), 400
+    
+    width = min(max(width, 1), app.config['HEATMAP_HISTORY_MAX_WIDTH'])
+    
+    # Only cameras that are recording or left tiles on disk, never a new history per query
+    if source not in heatmap_histories and not os.path.isdir(heatmap_history_folder(source)):
+        return jsonify({'success': False, 'message': 'No heatmap history for this source'}), 404
+    
+    history = get_heatmap_history(source)
+    try:
+        grid, frames, tiles_read = history.query(start, end)
+    except OverflowError:
+        return jsonify({'success': False, 'message': 'start and end must be within the supported date range'}), 400
+    
+    if grid is None or not frames:
+        return jsonify({'success': False, 'message': 'No heatmap data for this range'}), 404
+    
+    # Tiles hold raw counts, the Gaussian spread is applied once on the summed grid
+    density = cv2.GaussianBlur(grid, (0, 0), app.config['HEATMAP_SIGMA'] / history.scale, borderType=cv2.BORDER_CONSTANT)
+    grid_height, grid_width = grid.shape
+    size = (width, max(1, round(grid_height * width / grid_width)))
+    _, buffer = cv2.imencode('.png', colorize_heatmap(density, size))
+    
+    return jsonify({
+        'success': True,
+        'source': source,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'frames': frames,
+        'tiles_read': tiles_read,
+        'grid_size': [grid_width, grid_height],
+        'peak_per_frame': round(float(grid.max()) / frames, 4),
+        'heatmap': base64.b64encode(buffer).decode('utf-8')
+    }), 200
+
+
 # ==================== END OF NEW ENDPOINTS ====================
 
 if __name__ == '__main__':
@@ -0,0 +1,157 @@
+import argparse
+import time
+
+import numpy as np
+
+from app import PersonTracker, app
+
+# Identity quality of the original nearest-centroid matcher vs PersonTracker on simulated walkers
+parser = argparse.ArgumentParser(description='Person tracker check on simulated crowds')
+parser.add_argument('--people', default='5,20,50,300,500', help='Comma separated people in the scene')
+parser.add_argument('--frames', type=int, default=300, help='Frames simulated per case')
+parser.add_argument('--miss', type=float, default=0.1, help='Chance a person is not detected in a frame')
+parser.add_argument('--clutter', type=float, default=1.0, help='Average low-confidence false boxes per frame')
+parser.add_argument('--noise', type=float, default=3.0, help='Box corner noise in pixels')
+parser.add_argument('--width', type=int, default=1280)
+parser.add_argument('--height', type=int, default=720)
+parser.add_argument('--fps', type=float, default=30, help='Frame rate the tracker has to keep up with')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+rng = np.random.default_rng(args.seed)
+line = {'start': {'x': 0, 'y': args.height // 2}, 'end': {'x': args.width, 'y': args.height // 2}}
+
+def simulate(people):
+    """Per frame: (N, 6) boxes and the person each box belongs to (-1 for clutter), plus how many people crossed"""
+    position = rng.uniform([50, 50], [args.width - 50, args.height - 100], size=(people, 2))
+    velocity = rng.uniform(-6, 6, size=(people, 2))
+    size = np.column_stack([rng.uniform(30, 60, people), rng.uniform(80, 140, people)])
+    side = np.sign(position[:, 1] + size[:, 1] / 2 - args.height // 2)
+    crossed = np.zeros(people, dtype=bool)
+    frames = []
+
+    for _ in range(args.frames):
+        # Walkers drift, turn now and then and bounce off the frame edges
+        velocity += rng.normal(0, 0.3, velocity.shape)
+        position += velocity
+        for axis, limit in ((0, args.width), (1, args.height)):
+            low, high = position[:, axis] < 0, position[:, axis] + size[:, axis] > limit
+            velocity[low | high, axis] *= -1
+            position[:, axis] = np.clip(position[:, axis], 0, limit - size[:, axis])
+
+        new_side = np.sign(position[:, 1] + size[:, 1] / 2 - args.height // 2)
+        crossed |= (side != 0) & (new_side != 0) & (new_side != side)
+        side = np.where(new_side != 0, new_side, side)
+
+        seen = np.flatnonzero(rng.random(people) >= args.miss)
+        boxes = np.column_stack([position[seen], position[seen] + size[seen]])
+        boxes += rng.normal(0, args.noise, boxes.shape)
+        confidence = rng.uniform(0.35, 0.95, len(seen))
+
+        clutter = rng.poisson(args.clutter)
+        corner = rng.uniform([0, 0], [args.width - 60, args.height - 120], size=(clutter, 2))
+        clutter_boxes = np.column_stack([corner, corner + rng.uniform([30, 80], [60, 120], size=(clutter, 2))])
+
+        frames.append((
+            np.column_stack([
+                np.concatenate([boxes, clutter_boxes]),
+                np.concatenate([confidence, rng.uniform(0.25, 0.45, clutter)]),
+                np.zeros(len(seen) + clutter)
+            ]).astype(np.float32),
+            np.concatenate([seen, np.full(clutter, -1)])
+        ))
+
+    return frames, int(np.count_nonzero(crossed))
+
+class NearestCentroidTracker:
+    """The milestone_3 assign_person_id matcher: first known center within 100px, tracks never expire"""
+
+    def __init__(self):
+        self.tracks = {}
+        self.sides = {}
+        self.next_id = 1
+        self.crossed_ids = set()
+
+    def update(self, boxes, crossing_line):
+        ids = []
+        for x1, y1, x2, y2 in boxes[:, :4].tolist():
+            x, y = (x1 + x2) / 2, (y1 + y2) / 2
+            person_id = next((pid for pid, (px, py) in self.tracks.items() if np.hypot(x - px, y - py) < 100), None)
+            if person_id is None:
+                person_id = self.next_id
+                self.next_id += 1
+            self.tracks[person_id] = (x, y)
+
+            side = np.sign(y - crossing_line['start']['y'])
+            if self.sides.get(person_id, 0) and side and side != self.sides[person_id]:
+                self.crossed_ids.add(person_id)
+            self.sides[person_id] = side or self.sides.get(person_id, 0)
+            ids.append(person_id)
+        return np.array(ids, dtype=np.int64)
+
+def score(tracker, frames):
+    """ID switches, distinct ids, clutter boxes reported as people and ms per frame"""
+    last_id = {}
+    switches = 0
+    clutter_reported = 0
+    ids_seen = set()
+
+    start = time.perf_counter()
+    outputs = [tracker.update(boxes, line) for boxes, _ in frames]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(frames)
+
+    for (_, owners), ids in zip(frames, outputs):
+        for owner, track_id in zip(owners.tolist(), ids.tolist()):
+            if track_id <= 0:
+                continue
+            ids_seen.add(track_id)
+            if owner < 0:
+                clutter_reported += 1
+            elif last_id.get(owner, track_id) != track_id:
+                switches += 1
+            if owner >= 0:
+                last_id[owner] = track_id
+
+    return switches, len(ids_seen), clutter_reported, len(tracker.crossed_ids), elapsed_ms
+
+def new_tracker():
+    return PersonTracker(
+        max_age=app.config['TRACK_MAX_AGE'],
+        iou_threshold=app.config['TRACK_IOU_THRESHOLD'],
+        high_confidence=app.config['TRACK_HIGH_CONFIDENCE'],
+        max_distance=app.config['TRACK_MAX_DISTANCE'],
+        gate_chi2=app.config['TRACK_GATE_CHI2'],
+        max_tracks=app.config['TRACK_MAX_TRACKS']
+    )
+
+budget_ms = 1000 / args.fps
+
+print("=" * 92)
+print("📊 PERSON TRACKER CHECK")
+print("=" * 92)
+print(f"{args.frames} frames per case, {args.miss:.0%} missed detections, "
+      f"{args.clutter} clutter boxes per frame, ±{args.noise}px box noise")
+print(f"Budget {budget_ms:.1f} ms per frame for {args.fps:g} FPS")
+print("\n" + "-" * 92)
+print(f"{'People':>7}{'Tracker':>11}{'ID switches':>13}{'IDs':>7}{'Clutter':>9}"
+      f"{'Crossings':>11}{'True':>7}{'ms/frame':>10}{'Budget':>8}")
+print("-" * 92)
+
+for people in [int(v) for v in args.people.split(',')]:
+    frames, true_crossings = simulate(people)
+
+    for name, tracker in (('Centroid', NearestCentroidTracker()), ('Kalman', new_tracker())):
+        switches, ids, clutter, crossings, ms = score(tracker, frames)
+        print(f"{people:>7}{name:>11}{switches:>13}{ids:>7}{clutter:>9}{crossings:>11}{true_crossings:>7}{ms:>10.2f}"
+              f"{'✅' if ms <= budget_ms else '❌':>7}")
+
+print("-" * 92)
+print("ID switches: a person's id changed between two frames they were reported in")
+print("IDs:         distinct ids handed out, ideally the number of people")
+print("Clutter:     low-confidence false boxes given a track id (untracked ones are still counted)")
+print("Crossings:   ids counted across the middle line vs walkers that crossed it")
+print("Budget:      tracker time per frame fits in one frame interval at --fps")
+
+print("\n" + "=" * 92)
+print("✅ Check Complete!")
+print("=" * 92)
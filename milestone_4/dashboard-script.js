@@ -28,6 +28,18 @@ let videoCanvas, videoCtx;
 let isAnalyzing = false;
 let videoZoneCounter = 1;
 
+// WebSocket analysis channel
+let analysisSocket = null;
+let analysisInFlight = false;
+let analysisSocketConfig = null;
+let lastVideoDetections = [];
+let skippedVideoFrames = 0;
+
+// Server-side video analysis jobs
+let uploadedVideoFile = null;
+let videoJobId = null;
+let videoJobPollInterval = null;
+
 // Webcam Analysis variables
 let webcamLine = null;
 let webcamZones = {};
@@ -42,6 +54,15 @@ let webcamCanvas, webcamCtx;
 let maxWebcamPeopleCount = 0;
 let webcamZoneCounter = 1;
 
+// Server-push webcam stream (MJPEG frames + Server-Sent Events for counts)
+let useWebcamStream = true;
+let webcamStreamImage = null;
+let webcamEvents = null;
+let webcamStreamConfig = null;
+let webcamPreviewImage = null;
+let webcamPreviewId = null;
+let webcamHeatmapImage = null;
+
 // Live Dashboard variables
 let liveChart = null;
 let zoneChart = null;
@@ -95,6 +116,61 @@ async function authenticatedFetch(url, options = {}) {
   }
 }
 
+// Binary upload helpers
+function canvasToBlob(canvas, quality = 0.8) {
+  return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', quality));
+}
+
+function compactZones(zones) {
+  const compact = {};
+  for (const [zoneName, points] of Object.entries(zones)) {
+    compact[zoneName] = points.flatMap(p => [Math.round(p.x), Math.round(p.y)]);
+  }
+  return JSON.stringify(compact);
+}
+
+function compactLine(line) {
+  if (!line) return '';
+  return [line.start.x, line.start.y, line.end.x, line.end.y].map(Math.round).join(',');
+}
+
+function binaryAnalysisUrl(endpoint, params) {
+  const query = new URLSearchParams();
+  for (const [key, value] of Object.entries(params)) {
+    if (value !== undefined && value !== null && value !== '') {
+      query.set(key, value);
+    }
+  }
+  return `${API_BASE}/${endpoint}?${query.toString()}`;
+}
+
+async function postBinaryFrame(endpoint, blob, params) {
+  return authenticatedFetch(binaryAnalysisUrl(endpoint, params), {
+    method: 'POST',
+    headers: { 'Content-Type': 'image/jpeg' },
+    body: blob
+  });
+}
+
+// Zone sets the server has already compiled, unchanged zones are sent as a short id
+const knownZoneSets = {};
+
+function zoneSetParams(channel, zonesKey, zones) {
+  const known = knownZoneSets[channel];
+  if (known && known.key === zonesKey) {
+    return { zone_set_id: known.id };
+  }
+  return { zones };
+}
+
+function rememberZoneSet(channel, zonesKey, data) {
+  if (data.error === 'unknown_zone_set') {
+    delete knownZoneSets[channel];
+  } else if (data.zone_set_id) {
+    knownZoneSets[channel] = { key: zonesKey, id: data.zone_set_id };
+  }
+}
+
 window.onload = async function() {
   if (!isAuthenticated()) {
     window.location.href = 'index.html';
@@ -1166,7 +1242,7 @@ function drawDetectionWithCenter(ctx, det, color = '#ff00ff') {
   
   ctx.fillStyle = color;
   ctx.font = 'bold 16px Arial';
-  const label = `Person ${det.id}`;
+  const label = det.id ? `Person ${det.id}` : 'Person';
   ctx.fillText(label, x1, y1 - 5);
   
   ctx.font = '12px Arial';
@@ -1275,15 +1351,11 @@ async function analyzeImage() {
   document.getElementById('imageStatus').textContent = 'Analyzing...';
   
   try {
-    const imageData = imageCanvas.toDataURL('image/jpeg', 0.8);
+    const imageBlob = await canvasToBlob(imageCanvas, 0.8);
     
-    const res = await authenticatedFetch(`${API_BASE}/analyze_image`, {
-      method: 'POST',
-      body: JSON.stringify({
-        image: imageData,
-        zones: imageZones,
-        enable_heatmap: enableHeatmap
-      })
+    const res = await postBinaryFrame('analyze_image_binary', imageBlob, {
+      zones: compactZones(imageZones),
+      enable_heatmap: enableHeatmap
     });
     
     const data = await res.json();
@@ -1402,6 +1474,7 @@ function handleVideoUpload(event) {
   if (!file) return;
   
   document.getElementById('fileName').textContent = file.name;
+  uploadedVideoFile = file;
   uploadedVideo = document.createElement('video');
   const url = URL.createObjectURL(file);
   uploadedVideo.src = url;
@@ -1416,6 +1489,7 @@ function handleVideoUpload(event) {
     document.getElementById('videoPlaceholder').style.display = 'none';
     videoCanvas.style.display = 'block';
     document.getElementById('analyzeBtn').disabled = false;
+    document.getElementById('serverAnalyzeBtn').disabled = false;
     document.getElementById('drawLineBtn').disabled = false;
     document.getElementById('drawVideoZoneBtn').disabled = false;
   };
@@ -1581,6 +1655,150 @@ function redrawVideoFrame() {
   }
 }
 
+function drawVideoOverlays() {
+  for (const [zoneName, points] of Object.entries(videoZones)) {
+    drawZone(videoCtx, points, 'rgba(0, 255, 0, 0.3)', '#00ff00', zoneName);
+  }
+  
+  if (videoLine) {
+    videoCtx.strokeStyle = '#ff0000';
+    videoCtx.lineWidth = 3;
+    videoCtx.beginPath();
+    videoCtx.moveTo(videoLine.start.x, videoLine.start.y);
+    videoCtx.lineTo(videoLine.end.x, videoLine.end.y);
+    videoCtx.stroke();
+    
+    videoCtx.fillStyle = '#ff0000';
+    videoCtx.font = 'bold 16px Arial';
+    videoCtx.fillText('Crossing Line', videoLine.start.x, videoLine.start.y - 10);
+  }
+}
+
+function drawVideoDetections(detections) {
+  detections.forEach((det) => {
+    const [x1, y1, x2, y2] = det.bbox;
+    
+    videoCtx.strokeStyle = '#00ff00';
+    videoCtx.lineWidth = 2;
+    videoCtx.strokeRect(x1, y1, x2 - x1, y2 - y1);
+    
+    videoCtx.fillStyle = '#00ff00';
+    videoCtx.font = 'bold 16px Arial';
+    videoCtx.fillText(det.id ? `Person ${det.id}` : 'Person', x1, y1 - 5);
+  });
+}
+
+async function finishVideoAnalysisLoop() {
+  document.getElementById('analyzeBtn').disabled = false;
+  document.getElementById('pauseBtn').disabled = true;
+  closeAnalysisSocket();
+  
+  if (uploadedVideo && uploadedVideo.ended) {
+    const autoSave = confirm('Video analysis complete! Save results?');
+    if (autoSave) {
+      await saveVideoSession();
+    }
+  }
+}
+
+function openAnalysisSocket() {
+  return new Promise((resolve) => {
+    let socket;
+    try {
+      socket = new WebSocket(API_BASE.replace(/^http/, 'ws') + '/ws/analyze');
+    } catch (err) {
+      resolve(null);
+      return;
+    }
+    
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => socket.send(JSON.stringify({ type: 'auth', token: getToken() }));
+    socket.onerror = () => resolve(null);
+    socket.onclose = () => {
+      analysisSocket = null;
+      analysisInFlight = false;
+      resolve(null);
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      
+      if (message.type === 'auth') {
+        if (message.success) {
+          socket.onmessage = handleAnalysisSocketMessage;
+          resolve(socket);
+        } else {
+          socket.close();
+          resolve(null);
+        }
+      }
+    };
+  });
+}
+
+function closeAnalysisSocket() {
+  if (analysisSocket) {
+    analysisSocket.close();
+    analysisSocket = null;
+  }
+  analysisInFlight = false;
+  analysisSocketConfig = null;
+}
+
+function syncAnalysisSocketConfig() {
+  const config = JSON.stringify({ type: 'config', zones: videoZones, crossing_line: videoLine });
+  if (config !== analysisSocketConfig) {
+    analysisSocket.send(config);
+    analysisSocketConfig = config;
+  }
+}
+
+function handleAnalysisSocketMessage(event) {
+  const message = JSON.parse(event.data);
+  
+  if (message.type === 'result') {
+    analysisInFlight = false;
+    lastVideoDetections = message.detections || [];
+    updateVideoAnalysisStats(message);
+  } else if (message.type === 'error') {
+    analysisInFlight = false;
+    console.error('Frame analysis error:', message.message);
+  }
+}
+
+async function videoSocketLoop() {
+  if (!isAnalyzing || !analysisSocket) return;
+  
+  if (uploadedVideo.paused || uploadedVideo.ended) {
+    await finishVideoAnalysisLoop();
+    return;
+  }
+  
+  videoCtx.drawImage(uploadedVideo, 0, 0, videoCanvas.width, videoCanvas.height);
+  drawVideoOverlays();
+  
+  // Only one frame is in flight at a time, so a slow server makes us skip frames instead of queueing
+  if (!analysisInFlight) {
+    analysisInFlight = true;
+    syncAnalysisSocketConfig();
+    canvasToBlob(videoCanvas, 0.8).then(blob => {
+      if (analysisSocket && blob) {
+        analysisSocket.send(blob);
+      } else {
+        analysisInFlight = false;
+      }
+    });
+  } else {
+    skippedVideoFrames++;
+  }
+  
+  drawVideoDetections(lastVideoDetections);
+  
+  const elapsed = Math.floor((Date.now() - videoStartTime) / 1000);
+  document.getElementById('analysisDuration').textContent = elapsed + 's';
+  
+  requestAnimationFrame(videoSocketLoop);
+}
+
 async function startVideoAnalysis() {
   if (!uploadedVideo) {
     alert('Please upload a video first');
@@ -1594,45 +1812,31 @@ async function startVideoAnalysis() {
   
   uploadedVideo.currentTime = 0;
   videoStartTime = Date.now();
+  lastVideoDetections = [];
+  skippedVideoFrames = 0;
+  
+  analysisSocket = await openAnalysisSocket();
   
   await uploadedVideo.play();
   
+  if (analysisSocket) {
+    requestAnimationFrame(videoSocketLoop);
+    return;
+  }
+  
+  // Fall back to HTTP polling when the server has no WebSocket support
   videoAnalysisInterval = setInterval(async () => {
     if (uploadedVideo.paused || uploadedVideo.ended) {
       clearInterval(videoAnalysisInterval);
-      document.getElementById('analyzeBtn').disabled = false;
-      document.getElementById('pauseBtn').disabled = true;
-      
-      if (uploadedVideo.ended) {
-        const autoSave = confirm('Video analysis complete! Save results?');
-        if (autoSave) {
-          await saveVideoSession();
-        }
-      }
+      await finishVideoAnalysisLoop();
       return;
     }
     
     videoCtx.drawImage(uploadedVideo, 0, 0, videoCanvas.width, videoCanvas.height);
+    drawVideoOverlays();
     
-    for (const [zoneName, points] of Object.entries(videoZones)) {
-      drawZone(videoCtx, points, 'rgba(0, 255, 0, 0.3)', '#00ff00', zoneName);
-    }
-    
-    if (videoLine) {
-      videoCtx.strokeStyle = '#ff0000';
-      videoCtx.lineWidth = 3;
-      videoCtx.beginPath();
-      videoCtx.moveTo(videoLine.start.x, videoLine.start.y);
-      videoCtx.lineTo(videoLine.end.x, videoLine.end.y);
-      videoCtx.stroke();
-      
-      videoCtx.fillStyle = '#ff0000';
-      videoCtx.font = 'bold 16px Arial';
-      videoCtx.fillText('Crossing Line', videoLine.start.x, videoLine.start.y - 10);
-    }
-    
-    const frameData = videoCanvas.toDataURL('image/jpeg', 0.8);
-    await analyzeVideoFrame(frameData, Math.floor(uploadedVideo.currentTime * 30));
+    const frameBlob = await canvasToBlob(videoCanvas, 0.8);
+    await analyzeVideoFrame(frameBlob, Math.floor(uploadedVideo.currentTime * 30));
     
     const elapsed = Math.floor((Date.now() - videoStartTime) / 1000);
     document.getElementById('analysisDuration').textContent = elapsed + 's';
@@ -1649,80 +1853,223 @@ function pauseVideoAnalysis() {
     uploadedVideo.pause();
   }
   
+  closeAnalysisSocket();
   isAnalyzing = false;
   document.getElementById('analyzeBtn').disabled = false;
   document.getElementById('pauseBtn').disabled = true;
 }
 
-async function analyzeVideoFrame(frameData, frameNumber) {
+function updateVideoAnalysisStats(data) {
+  const currentPeople = data.people_count || 0;
+  const currentCrossings = data.crossed_count || 0;
+  
+  if (currentPeople > videoMaxPeopleCount) {
+    videoMaxPeopleCount = currentPeople;
+  }
+  
+  videoTotalCrossings = currentCrossings;
+  
+  if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
+    videoZoneCountsData = data.zone_counts;
+  }
+  
+  document.getElementById('videoPeopleCount').textContent = videoMaxPeopleCount;
+  document.getElementById('lineCrossings').textContent = videoTotalCrossings;
+  
+  if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
+    displayZoneCounts('videoZones', data.zone_counts);
+    document.getElementById('videoZoneList').style.display = 'block';
+  }
+  
+  if (data.alerts && data.alerts.length > 0) {
+    showAlert(data.alerts);
+  }
+}
+
+async function analyzeVideoFrame(frameBlob, frameNumber) {
   try {
-    const res = await authenticatedFetch(`${API_BASE}/analyze_frame`, {
-      method: 'POST',
-      body: JSON.stringify({
-        frame: frameData,
-        frame_number: frameNumber,
-        crossing_line: videoLine,
-        zones: videoZones
-      })
+    const zones = compactZones(videoZones);
+    const res = await postBinaryFrame('analyze_frame_binary', frameBlob, {
+      frame_number: frameNumber,
+      line: compactLine(videoLine),
+      ...zoneSetParams('video', zones, zones)
     });
     
     const data = await res.json();
+    rememberZoneSet('video', zones, data);
     
     if (data.success) {
       if (data.detections) {
-        data.detections.forEach((det) => {
-          const [x1, y1, x2, y2] = det.bbox;
-          
-          videoCtx.strokeStyle = '#00ff00';
-          videoCtx.lineWidth = 2;
-          videoCtx.strokeRect(x1, y1, x2 - x1, y2 - y1);
-          
-          videoCtx.fillStyle = '#00ff00';
-          videoCtx.font = 'bold 16px Arial';
-          videoCtx.fillText(`Person ${det.id}`, x1, y1 - 5);
-        });
-      }
-      
-      for (const [zoneName, points] of Object.entries(videoZones)) {
-        drawZone(videoCtx, points, 'rgba(0, 255, 0, 0.3)', '#00ff00', zoneName);
+        drawVideoDetections(data.detections);
       }
       
-      if (videoLine) {
-        videoCtx.strokeStyle = '#ff0000';
-        videoCtx.lineWidth = 3;
-        videoCtx.beginPath();
-        videoCtx.moveTo(videoLine.start.x, videoLine.start.y);
-        videoCtx.lineTo(videoLine.end.x, videoLine.end.y);
-        videoCtx.stroke();
-      }
-      
-      const currentPeople = data.people_count || 0;
-      const currentCrossings = data.crossed_count || 0;
-      
-      if (currentPeople > videoMaxPeopleCount) {
-        videoMaxPeopleCount = currentPeople;
-      }
-      
-      videoTotalCrossings = currentCrossings;
-      
-      if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
-        videoZoneCountsData = data.zone_counts;
-      }
-      
-      document.getElementById('videoPeopleCount').textContent = videoMaxPeopleCount;
-      document.getElementById('lineCrossings').textContent = videoTotalCrossings;
+      drawVideoOverlays();
+      updateVideoAnalysisStats(data);
+    }
+  } catch (err) {
+    console.error('Error analyzing frame:', err);
+  }
+}
+
+async function sha256Hex(buffer) {
+  const digest = await crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadFileInChunks(file, onProgress) {
+  const startRes = await authenticatedFetch(`${API_BASE}/uploads`, {
+    method: 'POST',
+    body: JSON.stringify({ filename: file.name, size: file.size })
+  });
+  const started = await startRes.json();
+  if (!started.success) throw new Error(started.message);
+  
+  const uploadId = started.upload_id;
+  const chunkSize = started.chunk_size;
+  let offset = 0;
+  let retries = 0;
+  
+  while (offset < file.size) {
+    const chunk = await file.slice(offset, offset + chunkSize).arrayBuffer();
+    
+    try {
+      const res = await authenticatedFetch(`${API_BASE}/uploads/${uploadId}?offset=${offset}`, {
+        method: 'PUT',
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          'X-Chunk-SHA256': await sha256Hex(chunk)
+        },
+        body: chunk
+      });
+      const data = await res.json();
       
-      if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
-        displayZoneCounts('videoZones', data.zone_counts);
-        document.getElementById('videoZoneList').style.display = 'block';
-      }
+      if (data.received === undefined) throw new Error(data.message);
+      offset = data.received;
+      retries = data.success ? 0 : retries + 1;
+    } catch (err) {
+      // Resume from whatever the server actually has
+      if (++retries > 5) throw err;
+      await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+      const statusRes = await authenticatedFetch(`${API_BASE}/uploads/${uploadId}`, { method: 'GET' });
+      offset = (await statusRes.json()).received;
+    }
+    
+    if (retries > 5) throw new Error('Upload failed');
+    onProgress(offset / file.size);
+  }
+  
+  const completeRes = await authenticatedFetch(`${API_BASE}/uploads/${uploadId}/complete`, { method: 'POST' });
+  const completed = await completeRes.json();
+  if (!completed.success) throw new Error(completed.message);
+  
+  return uploadId;
+}
+
+async function startServerVideoAnalysis() {
+  if (!uploadedVideoFile) {
+    alert('Please upload a video first');
+    return;
+  }
+  
+  document.getElementById('serverAnalyzeBtn').disabled = true;
+  
+  let uploadId;
+  try {
+    uploadId = await uploadFileInChunks(uploadedVideoFile, progress => {
+      document.getElementById('analysisDuration').textContent = `Upload ${Math.round(progress * 100)}%`;
+    });
+  } catch (err) {
+    console.error('Error uploading video:', err);
+    alert('Error uploading video: ' + err.message);
+    document.getElementById('serverAnalyzeBtn').disabled = false;
+    return;
+  }
+  
+  const formData = new FormData();
+  formData.append('upload_id', uploadId);
+  formData.append('zones', compactZones(videoZones));
+  formData.append('line', compactLine(videoLine));
+  formData.append('sample_fps', 2);
+  
+  try {
+    // FormData needs the browser to set its own multipart Content-Type
+    const res = await fetch(`${API_BASE}/video_jobs`, {
+      method: 'POST',
+      headers: { 'Authorization': `Bearer ${getToken()}` },
+      body: formData
+    });
+    
+    const data = await res.json();
+    
+    if (data.success) {
+      videoJobId = data.job_id;
+      videoJobPollInterval = setInterval(pollVideoJob, 1000);
+    } else {
+      alert('Failed to start server analysis: ' + data.message);
+      document.getElementById('serverAnalyzeBtn').disabled = false;
+    }
+  } catch (err) {
+    console.error('Error starting server analysis:', err);
+    alert('Error starting server analysis');
+    document.getElementById('serverAnalyzeBtn').disabled = false;
+  }
+}
+
+async function pollVideoJob() {
+  if (!videoJobId) return;
+  
+  try {
+    const res = await authenticatedFetch(`${API_BASE}/video_jobs/${videoJobId}`, { method: 'GET' });
+    const data = await res.json();
+    
+    if (!data.success) {
+      stopVideoJobPolling();
+      return;
+    }
+    
+    document.getElementById('analysisDuration').textContent = `${data.percent}%`;
+    
+    if (data.status !== 'running' && data.status !== 'queued') {
+      stopVideoJobPolling();
       
-      if (data.alerts && data.alerts.length > 0) {
-        showAlert(data.alerts);
+      if (data.status === 'completed') {
+        await loadVideoJobResults();
+      } else {
+        alert('Server analysis ' + data.status + (data.error ? ': ' + data.error : ''));
       }
     }
   } catch (err) {
-    console.error('Error analyzing frame:', err);
+    console.error('Error polling video job:', err);
+  }
+}
+
+function stopVideoJobPolling() {
+  if (videoJobPollInterval) {
+    clearInterval(videoJobPollInterval);
+    videoJobPollInterval = null;
+  }
+  document.getElementById('serverAnalyzeBtn').disabled = !uploadedVideoFile;
+}
+
+async function loadVideoJobResults() {
+  const res = await authenticatedFetch(`${API_BASE}/video_jobs/${videoJobId}/results`, { method: 'GET' });
+  const data = await res.json();
+  
+  if (!data.success) return;
+  
+  const lastFrame = data.frames[data.frames.length - 1] || {};
+  updateVideoAnalysisStats({
+    people_count: data.summary.max_people,
+    crossed_count: data.summary.total_crossings,
+    zone_counts: lastFrame.zone_counts || {}
+  });
+  
+  document.getElementById('analysisDuration').textContent = data.summary.duration_sec + 's';
+  document.getElementById('saveVideoBtn').disabled = false;
+  
+  const autoSave = confirm(`Server analysis complete! ${data.frames_analyzed} frames analyzed. Save results?`);
+  if (autoSave) {
+    await saveVideoSession();
   }
 }
 
@@ -1732,6 +2079,11 @@ async function resetVideoAnalysis() {
     videoAnalysisInterval = null;
   }
   
+  closeAnalysisSocket();
+  stopVideoJobPolling();
+  videoJobId = null;
+  uploadedVideoFile = null;
+  
   if (uploadedVideo) {
     uploadedVideo.pause();
     uploadedVideo = null;
@@ -1756,6 +2108,7 @@ async function resetVideoAnalysis() {
   document.getElementById('videoZoneCount').textContent = '0';
   document.getElementById('analysisDuration').textContent = '0s';
   document.getElementById('analyzeBtn').disabled = true;
+  document.getElementById('serverAnalyzeBtn').disabled = true;
   document.getElementById('pauseBtn').disabled = true;
   document.getElementById('saveVideoBtn').disabled = true;
   videoCanvas.style.display = 'none';
@@ -1790,7 +2143,11 @@ async function startWebcam() {
       
       webcamStartTime = Date.now();
       
-      webcamAnalysisInterval = setInterval(getWebcamFrame, 500);
+      if (useWebcamStream) {
+        startWebcamStream();
+      } else {
+        webcamAnalysisInterval = setInterval(getWebcamFrame, 500);
+      }
     } else {
       alert('Failed to start webcam: ' + data.message);
     }
@@ -1807,6 +2164,8 @@ async function stopWebcam() {
       webcamAnalysisInterval = null;
     }
     
+    stopWebcamStream();
+    
     const res = await authenticatedFetch(`${API_BASE}/stop_webcam`, {
       method: 'POST'
     });
@@ -1832,57 +2191,182 @@ async function stopWebcam() {
   }
 }
 
+function startWebcamStream() {
+  const token = encodeURIComponent(getToken());
+  
+  webcamStreamImage = new Image();
+  webcamStreamImage.onerror = () => {
+    // Server has no pipeline running, fall back to polling
+    stopWebcamStream();
+    if (webcamActive && !webcamAnalysisInterval) {
+      webcamAnalysisInterval = setInterval(getWebcamFrame, 500);
+    }
+  };
+  webcamStreamImage.src = `${API_BASE}/webcam_stream?token=${token}`;
+  
+  webcamEvents = new EventSource(`${API_BASE}/webcam_events?token=${token}`);
+  let lastStatsUpdate = 0;
+  webcamEvents.onmessage = (event) => {
+    // Frames may arrive much faster than 2 FPS, keep the chart on its usual cadence
+    const now = Date.now();
+    if (now - lastStatsUpdate < 500) return;
+    lastStatsUpdate = now;
+    updateWebcamStats(JSON.parse(event.data));
+  };
+  
+  requestAnimationFrame(drawWebcamStreamFrame);
+}
+
+function stopWebcamStream() {
+  if (webcamEvents) {
+    webcamEvents.close();
+    webcamEvents = null;
+  }
+  if (webcamStreamImage) {
+    webcamStreamImage.onerror = null;
+    webcamStreamImage.src = '';
+    webcamStreamImage = null;
+  }
+  webcamStreamConfig = null;
+  webcamPreviewImage = null;
+  webcamPreviewId = null;
+  webcamHeatmapImage = null;
+}
+
+function drawWebcamStreamFrame() {
+  if (!webcamActive || !webcamStreamImage) return;
+  
+  if (webcamStreamImage.naturalWidth > 0) {
+    if (webcamCanvas.width !== webcamStreamImage.naturalWidth) {
+      webcamCanvas.width = webcamStreamImage.naturalWidth;
+      webcamCanvas.height = webcamStreamImage.naturalHeight;
+    }
+    webcamCtx.drawImage(webcamStreamImage, 0, 0);
+  }
+  
+  syncWebcamStreamConfig();
+  requestAnimationFrame(drawWebcamStreamFrame);
+}
+
+function syncWebcamStreamConfig() {
+  const config = JSON.stringify({ crossing_line: webcamLine, zones: webcamZones, enable_heatmap: enableHeatmap });
+  if (config === webcamStreamConfig) return;
+  
+  webcamStreamConfig = config;
+  authenticatedFetch(`${API_BASE}/webcam_stream_config`, {
+    method: 'POST',
+    body: config
+  }).catch(err => console.error('Error updating stream config:', err));
+}
+
+function updateWebcamStats(data) {
+  const currentCount = data.count || 0;
+  document.getElementById('webcamPeopleCount').textContent = currentCount;
+  document.getElementById('webcamCrossings').textContent = data.crossed_count || 0;
+  
+  if (currentCount > maxWebcamPeopleCount) {
+    maxWebcamPeopleCount = currentCount;
+    document.getElementById('webcamMaxCount').textContent = maxWebcamPeopleCount;
+  }
+  
+  const timestamp = new Date().toLocaleTimeString();
+  updateLiveChart(currentCount, timestamp);
+  
+  if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
+    displayZoneCounts('webcamZones', data.zone_counts);
+    document.getElementById('webcamZoneList').style.display = 'block';
+    drawZoneBarChart(data.zone_counts);
+  }
+  
+  if (data.alerts && data.alerts.length > 0) {
+    showAlert(data.alerts);
+  }
+}
+
 async function getWebcamFrame() {
   if (!webcamActive) return;
   
   try {
+    const zonesKey = JSON.stringify(webcamZones);
     const res = await authenticatedFetch(`${API_BASE}/get_webcam_frame`, {
       method: 'POST',
       body: JSON.stringify({
         crossing_line: webcamLine,
-        zones: webcamZones,
-        enable_heatmap: enableHeatmap
+        ...zoneSetParams('webcam', zonesKey, webcamZones),
+        enable_heatmap: enableHeatmap,
+        response_mode: 'geometry',
+        preview_id: webcamPreviewId
       })
     });
     
     const data = await res.json();
+    rememberZoneSet('webcam', zonesKey, data);
     
     if (data.success) {
-      const img = new Image();
-      img.onload = function() {
-        webcamCanvas.width = img.width;
-        webcamCanvas.height = img.height;
-        webcamCtx.drawImage(img, 0, 0);
-      };
-      img.src = 'data:image/jpeg;base64,' + data.frame;
-      
-      const currentCount = data.count || 0;
-      document.getElementById('webcamPeopleCount').textContent = currentCount;
-      document.getElementById('webcamCrossings').textContent = data.crossed_count || 0;
-      
-      if (currentCount > maxWebcamPeopleCount) {
-        maxWebcamPeopleCount = currentCount;
-        document.getElementById('webcamMaxCount').textContent = maxWebcamPeopleCount;
+      if (data.heatmap) {
+        const heatmapImg = new Image();
+        heatmapImg.onload = function() {
+          webcamHeatmapImage = heatmapImg;
+        };
+        heatmapImg.src = 'data:image/jpeg;base64,' + data.heatmap;
       }
       
-      const timestamp = new Date().toLocaleTimeString();
-      updateLiveChart(currentCount, timestamp);
-      
-      if (data.zone_counts && Object.keys(data.zone_counts).length > 0) {
-        displayZoneCounts('webcamZones', data.zone_counts);
-        document.getElementById('webcamZoneList').style.display = 'block';
-        drawZoneBarChart(data.zone_counts);
+      // The server only sends a new preview about once a second, overlays are drawn here every poll
+      if (data.preview) {
+        const img = new Image();
+        img.onload = function() {
+          webcamPreviewImage = img;
+          drawWebcamGeometry(data);
+        };
+        img.src = 'data:image/jpeg;base64,' + data.preview;
+        webcamPreviewId = data.preview_id;
+      } else {
+        drawWebcamGeometry(data);
       }
       
-      if (data.alerts && data.alerts.length > 0) {
-        showAlert(data.alerts);
-      }
+      updateWebcamStats(data);
     }
   } catch (err) {
     console.error('Error getting webcam frame:', err);
   }
 }
 
+function drawWebcamGeometry(data) {
+  const [width, height] = data.frame_size;
+  if (webcamCanvas.width !== width || webcamCanvas.height !== height) {
+    webcamCanvas.width = width;
+    webcamCanvas.height = height;
+  }
+  
+  if (webcamPreviewImage) {
+    webcamCtx.drawImage(webcamPreviewImage, 0, 0, width, height);
+  } else {
+    webcamCtx.fillStyle = '#000';
+    webcamCtx.fillRect(0, 0, width, height);
+  }
+  
+  if (enableHeatmap && webcamHeatmapImage) {
+    webcamCtx.globalAlpha = 0.3;
+    webcamCtx.drawImage(webcamHeatmapImage, 0, 0, width, height);
+    webcamCtx.globalAlpha = 1;
+  }
+  
+  Object.entries(webcamZones).forEach(([zoneName, points]) => {
+    drawZone(webcamCtx, points, 'rgba(0, 255, 255, 0.15)', '#00ffff', `${zoneName}: ${data.zone_counts[zoneName] || 0}`);
+  });
+  
+  if (webcamLine) {
+    webcamCtx.strokeStyle = '#ff0000';
+    webcamCtx.lineWidth = 3;
+    webcamCtx.beginPath();
+    webcamCtx.moveTo(webcamLine.start.x, webcamLine.start.y);
+    webcamCtx.lineTo(webcamLine.end.x, webcamLine.end.y);
+    webcamCtx.stroke();
+  }
+  
+  data.detections.forEach(det => drawDetectionWithCenter(webcamCtx, det, '#00ff00'));
+}
+
 function drawWebcamLine() {
   if (isDrawingWebcamLine) {
     isDrawingWebcamLine = false;
@@ -2013,6 +2497,7 @@ async function resetWebcamCrossings() {
     
     if (data.success) {
       document.getElementById('webcamCrossings').textContent = '0';
+      webcamHeatmapImage = null;
       alert('Crossings and heatmap reset!');
     }
   } catch (err) {
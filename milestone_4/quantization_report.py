@@ -0,0 +1,78 @@
+import argparse
+import csv
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+from app import app, export_model, load_calibration_frames
+
+# Compare the FP32 PyTorch detector with the INT8 ONNX detector on the same frames
+parser = argparse.ArgumentParser(description='INT8 vs FP32 person detector report')
+parser.add_argument('--media', default=app.config['CALIBRATION_DIR'], help='Folder with sample images/videos')
+parser.add_argument('--frames', type=int, default=app.config['CALIBRATION_MAX_FRAMES'], help='Maximum frames to compare')
+parser.add_argument('--conf', type=float, default=0.25, help='Detection confidence threshold')
+parser.add_argument('--csv', help='Optional path to write per-frame results')
+args = parser.parse_args()
+
+def count_and_time(detector, frame):
+    start = time.perf_counter()
+    results = detector(frame, conf=args.conf, classes=[0], verbose=False)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return len(results[0].boxes), elapsed_ms
+
+print("=" * 60)
+print("📊 INT8 QUANTIZATION REPORT")
+print("=" * 60)
+
+weights = app.config['MODEL_WEIGHTS']
+fp32_model = YOLO(weights)
+int8_model = YOLO(export_model(weights, 'onnx_int8'), task='detect')
+
+frames = load_calibration_frames(args.media, args.frames)
+if not frames:
+    print(f"❌ No media found in {args.media}")
+    raise SystemExit(1)
+
+print(f"\nFrames: {len(frames)} from {args.media}")
+
+# Warm up both runtimes so the first call does not skew latency
+count_and_time(fp32_model, frames[0])
+count_and_time(int8_model, frames[0])
+
+rows = []
+for index, frame in enumerate(frames):
+    fp32_count, fp32_ms = count_and_time(fp32_model, frame)
+    int8_count, int8_ms = count_and_time(int8_model, frame)
+    rows.append([index, fp32_count, int8_count, fp32_ms, int8_ms])
+
+rows = np.array(rows, dtype=np.float64)
+fp32_counts, int8_counts = rows[:, 1], rows[:, 2]
+fp32_latency, int8_latency = rows[:, 3], rows[:, 4]
+
+count_error = np.abs(fp32_counts - int8_counts)
+relative_error = count_error.sum() / max(fp32_counts.sum(), 1)
+
+print("\n" + "-" * 60)
+print(f"{'':24}{'FP32 (pt)':>16}{'INT8 (onnx)':>16}")
+print(f"{'Mean latency (ms)':24}{fp32_latency.mean():>16.1f}{int8_latency.mean():>16.1f}")
+print(f"{'P95 latency (ms)':24}{np.percentile(fp32_latency, 95):>16.1f}{np.percentile(int8_latency, 95):>16.1f}")
+print(f"{'Frames/sec':24}{1000 / fp32_latency.mean():>16.1f}{1000 / int8_latency.mean():>16.1f}")
+print(f"{'Total people':24}{int(fp32_counts.sum()):>16}{int(int8_counts.sum()):>16}")
+print("-" * 60)
+print(f"Speedup:                 {fp32_latency.mean() / int8_latency.mean():.2f}x")
+print(f"Frames with equal count: {np.mean(count_error == 0) * 100:.1f}%")
+print(f"Mean abs count error:    {count_error.mean():.2f} people/frame")
+print(f"Relative count error:    {relative_error * 100:.1f}%")
+
+if args.csv:
+    with open(args.csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Frame', 'FP32 Count', 'INT8 Count', 'FP32 ms', 'INT8 ms'])
+        for row in rows:
+            writer.writerow([int(row[0]), int(row[1]), int(row[2]), f'{row[3]:.2f}', f'{row[4]:.2f}'])
+    print(f"\n✅ Per-frame results written to {args.csv}")
+
+print("\n" + "=" * 60)
+print("✅ Report Complete!")
+print("=" * 60)